@@ -0,0 +1,134 @@
+/*
+Chunked and resumable upload of project archives and videos (see
+utils/upload.py). Interrupted uploads of the same file are resumed from
+the last chunk the server received. Several files are uploaded one after
+the other.
+*/
+(function () {
+    var CHUNK_SIZE = 8 * 1024 * 1024;
+    var RETRIES = 3;
+    // Upload buttons along with the components that show their progress
+    // and receive the uploaded files.
+    var TARGETS = {
+        "upload-button": {progress: "upload-progress", store: "upload-file", accept: ".zip"},
+        "video-upload-button": {
+            progress: "video-upload-progress",
+            store: "video-upload-file",
+            accept: "video/*,.zip",
+        },
+    };
+
+    function setProps(id, props) {
+        window.dash_clientside.set_props(id, props);
+    }
+
+    function request(method, url, body) {
+        return fetch(url, {
+            method: method,
+            body: body,
+            headers: body ? {"Content-Type": "application/octet-stream"} : {},
+        }).then(function (response) {
+            if (!response.ok && response.status !== 409) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        });
+    }
+
+    function getUpload(file) {
+        var storageKey = "wanki-upload:" + [file.name, file.size, file.lastModified].join(":");
+        var id = window.localStorage.getItem(storageKey);
+        var existing = id ? request("GET", "upload/" + id).catch(function () { return null; }) : Promise.resolve(null);
+        return existing.then(function (upload) {
+            if (upload) {
+                return upload;
+            }
+            return request("POST", "upload").then(function (upload) {
+                window.localStorage.setItem(storageKey, upload.id);
+                return upload;
+            });
+        }).then(function (upload) {
+            upload.storageKey = storageKey;
+            return upload;
+        });
+    }
+
+    function sendChunks(file, upload, retries, onProgress) {
+        if (upload.size >= file.size) {
+            return Promise.resolve(upload);
+        }
+        onProgress(upload.size / file.size);
+        var chunk = file.slice(upload.size, upload.size + CHUNK_SIZE);
+        return request("PUT", "upload/" + upload.id + "?offset=" + upload.size, chunk)
+            .then(function (response) {
+                upload.size = response.size;
+                return sendChunks(file, upload, RETRIES, onProgress);
+            })
+            .catch(function (error) {
+                if (retries <= 0) {
+                    throw error;
+                }
+                return request("GET", "upload/" + upload.id).then(function (response) {
+                    upload.size = response.size;
+                    return sendChunks(file, upload, retries - 1, onProgress);
+                });
+            });
+    }
+
+    function uploadFiles(files, target) {
+        var uploads = [];
+        setProps(target.progress, {value: 0, style: {display: "flex"}});
+        files.reduce(function (previous, file, i) {
+            function onProgress(fraction) {
+                setProps(target.progress, {value: Math.floor(100 * (i + fraction) / files.length)});
+            }
+            return previous.then(function () {
+                return getUpload(file)
+                    .then(function (upload) {
+                        return sendChunks(file, upload, RETRIES, onProgress);
+                    })
+                    .then(function (upload) {
+                        window.localStorage.removeItem(upload.storageKey);
+                        uploads.push({id: upload.id, filename: file.name, modified: file.lastModified});
+                    })
+                    .catch(function (error) {
+                        uploads.push({id: null, filename: file.name, modified: file.lastModified});
+                        throw error;
+                    });
+            });
+        }, Promise.resolve())
+            .then(function () {
+                setProps(target.progress, {value: 100, style: {display: "none"}});
+                setProps(target.store, {data: uploads});
+            })
+            .catch(function () {
+                // The uploads that did succeed are sent anyway so that the
+                // server removes them.
+                setProps(target.progress, {style: {display: "none"}});
+                setProps(target.store, {data: uploads});
+            });
+    }
+
+    document.addEventListener("click", function (event) {
+        var button = null;
+        Object.keys(TARGETS).forEach(function (id) {
+            if (event.target.closest("#" + id)) {
+                button = id;
+            }
+        });
+        if (!button) {
+            return;
+        }
+        var target = TARGETS[button];
+        var input = document.createElement("input");
+        input.type = "file";
+        input.accept = target.accept;
+        input.multiple = true;
+        input.addEventListener("change", function () {
+            if (input.files.length) {
+                uploadFiles(Array.prototype.slice.call(input.files), target);
+            }
+        });
+        input.click();
+    });
+})();
@@ -0,0 +1,289 @@
+"""
+Benchmarks the ingestion and the analyses of the app over synthetic
+Wildlife Insights projects of several sizes, optionally comparing the
+results with those of a previous run.
+
+    python benchmark.py --images 10000 100000 --deployments 10 100
+    python benchmark.py --compare benchmarks/benchmark-20240101-120000.csv
+"""
+import argparse
+import contextlib
+import datetime
+import itertools
+import pathlib
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import pandas as pd
+import psutil
+from plotly.io.json import to_json_plotly
+
+from utils import analyses, cache, ingest, metrics, paging, storage, synthetic
+
+# Parameters of the analyses that have no default, given the species of
+# the project (most abundant first).
+PARAMS = {
+    "activity-hours": lambda species: {"names": species[:3]},
+    "presence-absence": lambda species: {"name": species[0]},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        epilog="analyses: " + ", ".join(analyses.ANALYSES),
+    )
+    parser.add_argument(
+        "--images", nargs="+", type=int, default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--deployments", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--species", type=int, default=100)
+    parser.add_argument(
+        "-a",
+        "--analysis",
+        action="append",
+        choices=list(analyses.ANALYSES),
+        help="analysis to run (all by default)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs of each step (the best is kept)"
+    )
+    parser.add_argument(
+        "--data-dir",
+        type=pathlib.Path,
+        default="benchmarks/data",
+        help="directory where the synthetic projects are kept",
+    )
+    parser.add_argument("-o", "--output-dir", type=pathlib.Path, default="benchmarks")
+    parser.add_argument(
+        "--compare", type=pathlib.Path, help="results of a previous run"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown reported as a regression",
+    )
+
+    return parser.parse_args()
+
+
+def get_project(data_dir, n_images, n_deployments, n_species):
+    """
+    Gets the path of a synthetic project, generating it the first time.
+    """
+    path = data_dir.joinpath(f"synthetic-{n_images}-{n_deployments}-{n_species}.zip")
+    if not path.exists():
+        data_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        synthetic.make_project(tmp, n_images, n_deployments, n_species)
+        tmp.replace(path)
+
+    return path
+
+
+@contextlib.contextmanager
+def track_memory(interval=0.005):
+    """
+    Tracks the peak resident memory of the process while the block it
+    wraps runs, by sampling it from another thread (unlike tracing
+    allocations, this neither slows the block down nor misses the memory
+    allocated by native libraries). Yields a dict where the increase of
+    the peak over the memory in use at the start is set.
+    """
+    process = psutil.Process()
+    baseline = process.memory_info().rss
+    peak = baseline
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(interval):
+            peak = max(peak, process.memory_info().rss)
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    usage = {}
+    try:
+        yield usage
+    finally:
+        done.set()
+        thread.join()
+        usage["peak"] = max(peak, process.memory_info().rss) - baseline
+
+
+def measure(function, repeat):
+    """
+    Runs function repeat times. Returns the result of the last run, the
+    best time (in seconds) and the largest peak memory (in bytes).
+    """
+    seconds = []
+    peaks = []
+    for _ in range(repeat):
+        with track_memory() as usage:
+            start = time.perf_counter()
+            result = function()
+            seconds.append(time.perf_counter() - start)
+        peaks.append(usage["peak"])
+
+    return result, min(seconds), max(peaks)
+
+
+def _serialize(result, kind):
+    # Tables send their first page and figures the whole figure, as the
+    # callbacks do.
+    if kind == "table":
+        result, _ = paging.get_page(result, 0, 50, [], "")
+
+    return to_json_plotly(result)
+
+
+def benchmark_project(path, ids, repeat):
+    """
+    Benchmarks the ingestion of a project and the analyses in ids, each
+    run from a cold cache (loading its tables and derived structures).
+    Returns a row per step.
+    """
+    key = f"benchmark-{uuid.uuid4().hex}"
+    rows = []
+    try:
+        _, seconds, peak = measure(
+            lambda: ingest.store_project(path, key), repeat
+        )
+        rows.append({"step": "ingest", "seconds": seconds, "peak_memory": peak})
+        data = {"key": key}
+        species = (
+            cache.get_tables(data, ("images",))["images"]["scientific_name"]
+            .value_counts()
+            .index.tolist()
+        )
+
+        for id_ in ids:
+            kind = analyses.ANALYSES[id_]["kind"]
+            params = PARAMS[id_](species) if id_ in PARAMS else {}
+
+            def run():
+                cache.projects.clear()
+                return analyses.run(id_, data, **params)
+
+            print(f"  {id_}", flush=True)
+            step = id_
+            try:
+                result, seconds, peak = measure(run, repeat)
+                rows.append(
+                    {
+                        "step": step,
+                        "seconds": seconds,
+                        "peak_memory": peak,
+                        "rows": metrics.count_rows(result),
+                    }
+                )
+
+                step = f"{id_}:serialize"
+                payload, seconds, peak = measure(
+                    lambda: _serialize(result, kind), repeat
+                )
+                rows.append(
+                    {
+                        "step": step,
+                        "seconds": seconds,
+                        "peak_memory": peak,
+                        "payload_bytes": len(payload),
+                    }
+                )
+                if kind == "table" and result.shape[1]:
+                    step = f"{id_}:page"
+                    sort_by = [{"column_id": result.columns[-1], "direction": "desc"}]
+                    _, seconds, peak = measure(
+                        lambda: paging.get_page(result, 0, 50, sort_by, ""),
+                        repeat,
+                    )
+                    rows.append(
+                        {"step": step, "seconds": seconds, "peak_memory": peak}
+                    )
+            except Exception as e:
+                # A broken analysis is recorded instead of discarding the
+                # results of the others.
+                rows.append({"step": step, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        cache.projects.clear()
+        shutil.rmtree(storage.storage_dir.joinpath(key), ignore_errors=True)
+
+    return rows
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=pathlib.Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the times of the steps with those of a previous run. Returns
+    a table with the ratio of each step and whether it regressed.
+    """
+    on = ["n_images", "n_deployments", "step"]
+    comparison = results[on + ["seconds"]].merge(
+        baseline[on + ["seconds"]], on=on, suffixes=("", "_baseline")
+    )
+    comparison["ratio"] = comparison["seconds"] / comparison["seconds_baseline"]
+    comparison["regression"] = comparison["ratio"] > 1 + threshold
+
+    return comparison
+
+
+def main():
+    args = parse_args()
+    ids = args.analysis or list(analyses.ANALYSES)
+    date = datetime.datetime.now()
+    run = {
+        "date": date.isoformat(timespec="seconds"),
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+    }
+
+    rows = []
+    for n_images, n_deployments in itertools.product(args.images, args.deployments):
+        path = get_project(args.data_dir, n_images, n_deployments, args.species)
+        print(f"{path.name}", flush=True)
+        for row in benchmark_project(path, ids, args.repeat):
+            rows.append(
+                {**run, "n_images": n_images, "n_deployments": n_deployments, **row}
+            )
+    results = pd.DataFrame(rows)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    output = args.output_dir.joinpath(f"benchmark-{date:%Y%m%d-%H%M%S}.csv")
+    results.to_csv(output, index=False)
+    summary = results.reindex(
+        columns=["n_images", "n_deployments", "step", "seconds", "peak_memory", "error"]
+    )
+    summary["peak_memory"] = summary["peak_memory"] / 2**20
+    summary = summary.rename(columns={"peak_memory": "peak_memory_mb"})
+    print(summary.round(3).to_string(index=False))
+    print(f"\nResults written to {output}")
+
+    if args.compare is not None:
+        comparison = compare(results, pd.read_csv(args.compare), args.threshold)
+        print(comparison.round(3).to_string(index=False))
+        if comparison["regression"].any():
+            print(f"\n{comparison['regression'].sum()} steps regressed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
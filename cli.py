@@ -0,0 +1,133 @@
+"""
+Runs the analyses of the app over one or many Wildlife Insights project
+archives in parallel, without starting the app.
+
+    python cli.py projects/ -o results/ -a hill-numbers -a accumulation-curve
+"""
+import argparse
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils import analyses, export, ingest, pipeline
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        epilog="analyses: " + ", ".join(analyses.ANALYSES),
+    )
+    parser.add_argument(
+        "projects", nargs="+", type=pathlib.Path, help="archives or directories"
+    )
+    parser.add_argument("-o", "--output-dir", type=pathlib.Path, default="results")
+    parser.add_argument(
+        "-a",
+        "--analysis",
+        action="append",
+        choices=list(analyses.ANALYSES),
+        help="analysis to run (all by default)",
+    )
+    parser.add_argument(
+        "-p",
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="parameter passed to the analyses that declare it",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=None,
+        help="interval (in minutes) used to remove duplicates",
+    )
+    parser.add_argument("--table-format", choices=list(export.FORMATS), default="csv")
+    parser.add_argument(
+        "--figure-format", choices=pipeline.FIGURE_FORMATS, default="html"
+    )
+    parser.add_argument(
+        "--combine",
+        action="store_true",
+        help="combine all the projects into a single dataset",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--report", type=pathlib.Path, help="CSV file for the report")
+
+    return parser.parse_args()
+
+
+def find_projects(paths):
+    projects = []
+    for path in paths:
+        if path.is_dir():
+            projects.extend(sorted(path.glob("*.zip")))
+        else:
+            projects.append(path)
+
+    return projects
+
+
+def main():
+    args = parse_args()
+    projects = find_projects(args.projects)
+    ids = args.analysis or list(analyses.ANALYSES)
+    params = {}
+    for param in args.param:
+        name, _, value = param.partition("=")
+        params[name] = pipeline.parse_param(value)
+
+    start = time.perf_counter()
+    reports = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        if args.combine:
+            futures = [
+                executor.submit(pipeline.ingest_project, path, args.interval)
+                for path in projects
+            ]
+            keys = []
+            for future in futures:
+                key, report = future.result()
+                reports.append(report)
+                if key is not None:
+                    keys.append(key)
+        else:
+            futures = [
+                executor.submit(
+                    pipeline.run_project,
+                    path,
+                    args.output_dir,
+                    ids,
+                    params,
+                    args.interval,
+                    args.table_format,
+                    args.figure_format,
+                )
+                for path in projects
+            ]
+            for future in futures:
+                reports.extend(future.result())
+    if args.combine and keys:
+        reports += pipeline.run_analyses(
+            "combined",
+            {"key": ingest.combine_keys(keys)},
+            args.output_dir.joinpath("combined"),
+            ids,
+            params,
+            args.table_format,
+            args.figure_format,
+        )
+    seconds = time.perf_counter() - start
+
+    report = pd.DataFrame(reports)
+    print(report.round(2).to_string(index=False))
+    print(f"\n{len(projects)} projects in {seconds:.2f} s")
+    if args.report is not None:
+        report.to_csv(args.report, index=False)
+
+
+if __name__ == "__main__":
+    main()
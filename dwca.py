@@ -0,0 +1,66 @@
+"""
+Builds the Darwin Core archives of a directory of Wildlife Insights
+project archives in parallel, without starting the app.
+
+    python dwca.py projects/ archives/ --workers 4 --interval 30
+"""
+import argparse
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from zipfile import BadZipFile
+
+import pandas as pd
+
+from utils import dwca
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input_dir", type=pathlib.Path)
+    parser.add_argument("output_dir", type=pathlib.Path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=None,
+        help="interval (in minutes) used to remove duplicates",
+    )
+    parser.add_argument("--report", type=pathlib.Path, help="CSV file for the report")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    paths = sorted(args.input_dir.glob("*.zip"))
+    start = time.perf_counter()
+    reports = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(dwca.build_archive, path, args.output_dir, args.interval): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except (KeyError, BadZipFile) as e:
+                report = {"project": futures[future].name, "error": str(e)}
+            reports.append(report)
+            print(f"{report['project']}: {report.get('error', 'ok')}", flush=True)
+    seconds = time.perf_counter() - start
+
+    report = pd.DataFrame(reports).set_index("project").sort_index()
+    print(report.round(2).to_string())
+    if "occurrences" in report:
+        print(
+            f"\n{len(paths)} projects in {seconds:.2f} s "
+            f"({report['occurrences'].sum() / seconds:.0f} occurrences/s)"
+        )
+    if args.report is not None:
+        report.to_csv(args.report)
+
+
+if __name__ == "__main__":
+    main()
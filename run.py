@@ -1,22 +1,85 @@
 """
-
+Runs the app. By default it is served by the development server of Flask
+and opened in the browser; with --production it is served by waitress,
+with a pool of threads, to be shared by several users. --startup-report
+prints how long the start of the app takes and exits.
 """
+import argparse
+import os
+import time
 import webbrowser
 from threading import Timer
 
-from utils.app import app
-from utils.callbacks import generate_callbacks
-from utils.layout import layout
+import psutil
+from plotly.io.json import to_json_plotly
+
+from utils import lazy
+from utils.layout import serve_layout
+from wsgi import STARTUP, app, warm_up
+
 
-port = 5000
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=os.environ.get("WANKI_HOST", "127.0.0.1"))
+    parser.add_argument(
+        "--port", type=int, default=int(os.environ.get("WANKI_PORT", 5000))
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=int(os.environ.get("WANKI_THREADS", 8)),
+        help="threads serving requests in production",
+    )
+    parser.add_argument("--production", action="store_true")
+    parser.add_argument("--no-browser", action="store_true")
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="print the time each phase of the start takes and exit",
+    )
 
+    return parser.parse_args()
 
-def open_browser():
+
+def open_browser(port):
     webbrowser.open_new("http://localhost:{}".format(port))
-    
+
+
+def print_startup_report():
+    """
+    Prints the time each phase of the start took, the time it takes to
+    load each lazily imported library and to build the layout (and its
+    size, which is sent to every new session).
+    """
+    print("Fases del inicio:")
+    for phase, seconds in STARTUP.items():
+        print(f"  {phase:<24} {seconds:8.3f} s")
+    print(f"  {'total':<24} {time.time() - psutil.Process().create_time():8.3f} s")
+
+    warm_up.join()
+    print("Bibliotecas cargadas en segundo plano:")
+    for name, seconds in lazy.load_all().items():
+        print(f"  {name:<24} {seconds:8.3f} s")
+
+    start = time.perf_counter()
+    layout = serve_layout()
+    seconds = time.perf_counter() - start
+    size = len(to_json_plotly(layout))
+    print("Diseño:")
+    print(f"  {'serve_layout':<24} {seconds:8.3f} s")
+    print(f"  {'tamaño':<24} {size / 1024:8.1f} KB")
+
+
 if __name__ == "__main__":
-    app.layout = layout
-    generate_callbacks(app)
-    Timer(1, open_browser).start()
-    #app.run_server(debug=False, port=port)
-    app.run_server(host='127.0.0.1', port=port, debug=False) #debug=False,
+    args = parse_args()
+    if args.startup_report:
+        print_startup_report()
+        raise SystemExit
+    if not args.no_browser:
+        Timer(1, open_browser, [args.port]).start()
+    if args.production:
+        import waitress
+
+        waitress.serve(app.server, host=args.host, port=args.port, threads=args.threads)
+    else:
+        app.run(host=args.host, port=args.port, debug=False)
@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+import wiutils
+
+from utils import analyses, cache, ingest, storage, synthetic
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "storage_dir", tmp_path.joinpath("projects"))
+    path = tmp_path.joinpath("project.zip")
+    synthetic.make_project(path, n_images=2000, n_deployments=20, n_species=30)
+    ingest.store_project(path, "test")
+    cache.projects.clear()
+    yield {"key": "test"}
+    cache.projects.clear()
+
+
+def test_hill_numbers_match_uncategorized(data):
+    images = cache.get_tables(data, ("images",))["images"]
+    assert isinstance(images["scientific_name"].dtype, pd.CategoricalDtype)
+    uncategorized = images.astype(
+        {column: object for column in images.select_dtypes("category")}
+    )
+    expected = wiutils.compute_hill_numbers(uncategorized, q_values=[0, 1, 2], pivot=1)
+
+    result = analyses.run("hill-numbers", data)
+
+    pd.testing.assert_frame_equal(result, expected)
+    richness = images.groupby("deployment_id", observed=True)["scientific_name"]
+    assert (
+        result.set_index("deployment_id")["0"]
+        == richness.nunique().reindex(result["deployment_id"])
+    ).all()
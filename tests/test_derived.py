@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import derived
+
+
+def create_images(n_species, n_images=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp("2021-01-01") + pd.to_timedelta(
+        rng.integers(0, 365 * 86400, n_images), unit="s"
+    )
+    names = [f"Genus species{i}" for i in range(n_species)]
+    species = rng.choice(names, n_images)
+    # Every species is detected at least once.
+    species[:n_species] = names
+
+    return pd.DataFrame(
+        {
+            "scientific_name": pd.Categorical(species),
+            "timestamp": timestamps.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    )
+
+
+@pytest.mark.parametrize("n_species", [40, 200])
+def test_activity_densities_match_histograms(n_species):
+    images = create_images(n_species)
+
+    activity = derived.compute_activity_densities(images)
+
+    bins = activity["counts"].shape[1]
+    timestamps = pd.to_datetime(images["timestamp"])
+    minutes = timestamps.dt.hour * 60 + timestamps.dt.minute
+    assert activity["species"].size == n_species
+    for name, counts in zip(activity["species"], activity["counts"]):
+        expected, _ = np.histogram(
+            minutes[images["scientific_name"] == name], bins=bins, range=(0, 1440)
+        )
+        np.testing.assert_array_equal(counts, expected)
+
+
+@pytest.mark.parametrize("n_species", [40, 200])
+def test_updated_activity_densities_match_rebuild(n_species):
+    images = create_images(n_species)
+    old, new = images.iloc[:3000], images.iloc[3000:]
+
+    activity = derived.update_activity_densities(
+        derived.compute_activity_densities(old), new
+    )
+
+    expected = derived.compute_activity_densities(images)
+    pd.testing.assert_index_equal(activity["species"], expected["species"])
+    np.testing.assert_array_equal(activity["counts"], expected["counts"])
+    np.testing.assert_allclose(activity["density"], expected["density"])
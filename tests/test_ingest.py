@@ -0,0 +1,110 @@
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import analyses, cache, ingest, storage, synthetic
+
+
+def write_project(path, images, deployments):
+    with zipfile.ZipFile(path, "w") as z:
+        for name, table in (
+            ("projects", synthetic.create_projects()),
+            ("deployments", deployments),
+            ("images", images),
+        ):
+            z.writestr(f"synthetic/{name}.csv", table.to_csv(index=False))
+
+    return path
+
+
+def assert_equal(value, expected):
+    if isinstance(expected, dict):
+        assert value.keys() == expected.keys()
+        for name in expected:
+            assert_equal(value[name], expected[name])
+    elif isinstance(expected, pd.Index):
+        pd.testing.assert_index_equal(value, expected)
+    elif isinstance(expected, pd.Series):
+        pd.testing.assert_series_equal(value, expected)
+    elif isinstance(expected, np.ndarray) and expected.dtype.kind == "f":
+        np.testing.assert_allclose(value, expected)
+    elif isinstance(expected, np.ndarray):
+        np.testing.assert_array_equal(value, expected)
+    else:
+        assert value == expected
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "storage_dir", tmp_path.joinpath("projects"))
+    rng = np.random.default_rng(0)
+    deployments = synthetic.create_deployments(10, rng)
+    images = synthetic.create_images(2000, deployments, 30, rng)
+    path = write_project(tmp_path.joinpath("base.zip"), images[:1500], deployments)
+    ingest.store_project(path, "base")
+    cache.projects.clear()
+    # Derived structures of the stored project, to be updated.
+    analyses.load_tables({"key": "base"}, list(analyses.DERIVED))
+    yield tmp_path, images, deployments
+    cache.projects.clear()
+
+
+def update(path, images, deployments):
+    key = ingest.update_project(write_project(path, images, deployments), "base")
+    metadata = cache.get_tables({"key": key}, ("metadata",))["metadata"]
+    assert metadata["base"] == "base"
+
+    return {"key": key}
+
+
+def assert_derived_match_rebuild(data):
+    updated = analyses.load_tables(data, list(analyses.DERIVED))
+    cache.projects.clear()
+    rebuilt = analyses.load_tables(data, list(analyses.DERIVED))
+    for name in analyses.DERIVED:
+        assert_equal(updated[name], rebuilt[name])
+
+
+def test_update_appends_new_images(project):
+    tmp_path, images, deployments = project
+
+    data = update(tmp_path.joinpath("update.zip"), images, deployments)
+
+    stored = cache.get_tables(data, ("images",))["images"]
+    assert stored["image_id"].tolist() == sorted(stored["image_id"])
+    expected = ingest.clean_images(images.copy())
+    assert stored["image_id"].tolist() == expected["image_id"].tolist()
+    assert_derived_match_rebuild(data)
+
+
+def test_update_without_new_images(project):
+    tmp_path, images, deployments = project
+    deployments = deployments.copy()
+    deployments.loc[0, "end_date"] = "2022-06-30"
+
+    data = update(tmp_path.joinpath("update.zip"), images[:1500], deployments)
+
+    tables = cache.get_tables(data, ("images", "deployments"))
+    base = cache.get_tables({"key": "base"}, ("images",))
+    pd.testing.assert_frame_equal(tables["images"], base["images"])
+    assert tables["deployments"].loc[0, "end_date"] == "2022-06-30"
+    assert_derived_match_rebuild(data)
+
+
+def test_update_with_unidentified_images(project):
+    tmp_path, images, deployments = project
+    unidentified = images[1500:].copy()
+    unidentified[["genus", "species", "common_name"]] = np.nan
+
+    data = update(
+        tmp_path.joinpath("update.zip"),
+        pd.concat([images[:1500], unidentified]),
+        deployments,
+    )
+
+    tables = cache.get_tables(data, ("images",))
+    base = cache.get_tables({"key": "base"}, ("images",))
+    pd.testing.assert_frame_equal(tables["images"], base["images"])
+    assert_derived_match_rebuild(data)
@@ -0,0 +1,39 @@
+import os
+import time
+
+import flask
+import pytest
+
+from utils import upload
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload, "upload_dir", tmp_path.joinpath("uploads"))
+    monkeypatch.setattr(upload, "max_size", 3 * 2**20)
+    app = flask.Flask(__name__)
+    upload.register_routes(app)
+
+    return app.test_client()
+
+
+def test_uploads_beyond_max_size_are_rejected(client):
+    id_ = client.post("/upload").json["id"]
+
+    response = client.put(f"/upload/{id_}?offset=0", data=b"x" * 2**21)
+    assert response.json["size"] == 2**21
+    response = client.put(f"/upload/{id_}?offset={2**21}", data=b"x" * 2**21)
+
+    assert response.status_code == 413
+    assert upload.get_upload_path(id_) is None
+
+
+def test_expired_uploads_are_removed(client):
+    id_ = client.post("/upload").json["id"]
+    path = upload.get_upload_path(id_)
+    os.utime(path, (time.time() - 2 * upload.max_age,) * 2)
+
+    client.post("/upload")
+
+    assert upload.get_upload_path(id_) is None
+    assert len(list(upload.upload_dir.glob("*.upload"))) == 1
@@ -0,0 +1,336 @@
+"""
+Registry of the analyses of the app. Each analysis declares the tables
+of the project (stored or derived) and the parameters it needs, so that
+its callback only ships and loads what the analysis actually uses.
+"""
+
+from utils import cache, derived, figures, lazy, metrics, reference, storage
+
+pd = lazy.Module("pandas")
+
+wiutils = lazy.Module("wiutils")
+
+ANALYSES = {}
+
+# Project of the results computed over all the projects of a dataset.
+POOLED = "Todos"
+
+# Structures derived from the tables of a project: the tables they need,
+# the function computing them and the one updating them with the images
+# appended to an updated project.
+DERIVED = {
+    "activity": (
+        ("images",),
+        lambda tables: derived.compute_activity_densities(tables["images"]),
+        lambda activity, tables, images: derived.update_activity_densities(
+            activity, images
+        ),
+    ),
+    "first-dates": (
+        ("images",),
+        lambda tables: derived.compute_first_dates(tables["images"]),
+        lambda first_dates, tables, images: derived.update_first_dates(
+            first_dates, images
+        ),
+    ),
+    "occupancy": (
+        ("images", "deployments"),
+        lambda tables: derived.build_occupancy(
+            tables["images"], tables["deployments"]
+        ),
+        lambda occupancy, tables, images: derived.update_occupancy(
+            occupancy, images, tables["deployments"]
+        ),
+    ),
+}
+
+
+def register(id_, kind, tables, params=None, background=False, zoom=False):
+    """
+    Registers an analysis. kind is either 'table' or 'figure', tables
+    are the names of the stored or derived tables the analysis needs,
+    params maps its keyword arguments to the ids of the components that
+    hold their values and background indicates whether it should run as
+    a background job. Figures with zoom are rebuilt when the user zooms
+    in, passing the ranges of the axes as x_range and y_range.
+    """
+
+    def decorator(function):
+        ANALYSES[id_] = {
+            "function": function,
+            "kind": kind,
+            "tables": tables,
+            "params": params or {},
+            "background": background,
+            "zoom": zoom,
+        }
+        return function
+
+    return decorator
+
+
+def load_tables(data, names):
+    """
+    Loads the stored and derived tables of a project. Returns None if
+    the project is not available.
+    """
+    tables = cache.get_tables(data, [name for name in names if name not in DERIVED])
+    if tables is None:
+        return None
+    for name in names:
+        if name in DERIVED:
+            dependencies, function, update = DERIVED[name]
+            tables[name] = cache.get_derived(
+                data, name, function, dependencies, update
+            )
+            if tables[name] is None:
+                return None
+
+    return tables
+
+
+def run(id_, data, **params):
+    """
+    Runs an analysis over the project in data. Returns None if the
+    project is not available.
+    """
+    analysis = ANALYSES[id_]
+    tables = load_tables(data, analysis["tables"])
+    if tables is None:
+        return None
+    if analysis["kind"] == "table":
+        # Tables are computed by wiutils, which expects plain columns.
+        tables = storage.decode_categoricals(tables)
+    with metrics.measure("analysis", id_) as record:
+        result = analysis["function"](tables, **params)
+        record["rows"] = metrics.count_rows(result)
+
+    return result
+
+
+def run_cached(id_, data, **params):
+    """
+    Runs an analysis, reusing its result if it was already computed for
+    the same project and parameters. Results of background analyses are
+    written to disk right away so that other processes can reuse them.
+    Returns the result and its key, or None and None if the project is
+    not available.
+    """
+    if cache.get_tables(data, ("metadata",)) is None:
+        return None, None
+    key_params = dict(params)
+    if "reference" in ANALYSES[id_]["tables"]:
+        # Results annotated with the reference expire when it is reloaded.
+        key_params["reference"] = reference.get_version()
+    key = cache.get_result_key(data["key"], id_, key_params)
+    result = cache.results.get(key)
+    if result is None:
+        result = run(id_, data, **params)
+        if result is not None:
+            cache.results.put(key, result, spill=ANALYSES[id_]["background"])
+
+    return result, key
+
+
+def split_projects(images):
+    """
+    Splits the images of a (combined) dataset by project. Categorical
+    columns of each project only keep the categories it uses.
+    """
+    for project_id, group in images.groupby("project_id", observed=True, sort=True):
+        group = group.copy()
+        for column in group.select_dtypes("category"):
+            group[column] = group[column].cat.remove_unused_categories()
+        yield project_id, group
+
+
+def compute_by_project(images, function):
+    """
+    Computes a table for each project and for all of them pooled,
+    concatenating the results with the project they belong to.
+    """
+    results = [
+        function(group).assign(project_id=project_id)
+        for project_id, group in split_projects(images)
+    ]
+    results.append(function(images).assign(project_id=POOLED))
+    result = pd.concat(results, ignore_index=True)
+
+    return result[["project_id", *result.columns.drop("project_id")]]
+
+
+@register(
+    "general-count",
+    "table",
+    ("images", "reference"),
+    {
+        "threat_status": "general-count-threat-status",
+        "endemic": "general-count-endemic",
+        "by_project": "general-count-by-project",
+    },
+    background=True,
+)
+def compute_general_count(tables, threat_status=None, endemic=None, by_project=None):
+    if by_project:
+        result = compute_by_project(
+            tables["images"],
+            lambda images: wiutils.compute_general_count(images, add_taxonomy=True),
+        )
+    else:
+        result = wiutils.compute_general_count(tables["images"], add_taxonomy=True)
+    result["scientific_name"] = wiutils.get_scientific_name(result)
+    # The reference is indexed by scientific name, so annotations are
+    # index lookups instead of merges.
+    if threat_status:
+        result["threat_status"] = (
+            tables["reference"]["threat_status"]
+            .reindex(result["scientific_name"])
+            .to_numpy()
+        )
+    if endemic:
+        result["establishment_means"] = (
+            tables["reference"]["establishment_means"]
+            .reindex(result["scientific_name"])
+            .to_numpy()
+        )
+
+    return result
+
+
+@register("dwc-events", "table", ("deployments", "projects"), background=True)
+def create_dwc_event(tables):
+    return wiutils.create_dwc_event(tables["deployments"], tables["projects"])
+
+
+@register(
+    "dwc-records", "table", ("images", "deployments", "projects"), background=True
+)
+def create_dwc_occurrence(tables):
+    return wiutils.create_dwc_occurrence(
+        tables["images"], tables["deployments"], tables["projects"]
+    )
+
+
+@register(
+    "deployment-detection",
+    "table",
+    ("images",),
+    {
+        "compute_abundance": "deployment-detection-compute-abundance",
+        "pivot": "deployment-detection-pivot",
+    },
+    background=True,
+)
+def compute_detection(tables, compute_abundance=1, pivot=1):
+    return wiutils.compute_detection(
+        tables["images"], compute_abundance=compute_abundance, pivot=pivot
+    )
+
+
+@register(
+    "detection-history",
+    "table",
+    ("images", "deployments"),
+    {
+        "days": "detection-history-days",
+        "date_range": "detection-history-date-range",
+        "compute_abundance": "detection-history-compute-abundance",
+        "pivot": "detection-history-pivot",
+    },
+    background=True,
+)
+def compute_detection_history(
+    tables, days=1, date_range="deployments", compute_abundance=1, pivot=1
+):
+    return wiutils.compute_detection_history(
+        tables["images"],
+        tables["deployments"],
+        date_range=date_range,
+        days=days,
+        compute_abundance=compute_abundance,
+        pivot=pivot,
+    )
+
+
+@register(
+    "hill-numbers",
+    "table",
+    ("images",),
+    {
+        "q": "hill-numbers-q",
+        "pivot": "hill-numbers-pivot",
+        "by_project": "hill-numbers-by-project",
+    },
+    background=True,
+)
+def compute_hill_numbers(tables, q="0,1,2", pivot=1, by_project=None):
+    q_values = list(map(lambda x: int(x), q.split(",")))
+
+    if by_project:
+        # Hill numbers of each project (and of all of them) as a whole
+        # instead of by deployment.
+        return compute_by_project(
+            tables["images"],
+            lambda images: wiutils.compute_hill_numbers(
+                images.assign(deployment_id=""), q_values=q_values, pivot=pivot
+            ).drop(columns="deployment_id"),
+        )
+
+    return wiutils.compute_hill_numbers(
+        tables["images"], q_values=q_values, pivot=pivot
+    )
+
+
+@register("deployment-summary", "table", ("images",), background=True)
+def compute_count_summary(tables):
+    return wiutils.compute_count_summary(tables["images"])
+
+
+@register(
+    "accumulation-curve",
+    "figure",
+    ("images", "deployments", "first-dates"),
+    {
+        "permutations": "accumulation-curve-permutations",
+        "by_project": "accumulation-curve-by-project",
+    },
+)
+def plot_accumulation_curve(tables, permutations=0, by_project=None):
+    fig = figures.plot_accumulation_curve(
+        tables["images"], tables["deployments"], permutations, tables["first-dates"]
+    )
+    if by_project:
+        deployments = tables["deployments"]
+        for project_id, images in split_projects(tables["images"]):
+            figures.add_accumulation_curve(
+                fig,
+                images,
+                deployments[deployments["project_id"] == project_id],
+                project_id,
+            )
+        fig.data[0].update(name=POOLED, showlegend=True)
+
+    return fig
+
+
+@register("site-dates", "figure", ("deployments",))
+def plot_site_dates(tables):
+    return figures.plot_site_dates(tables["deployments"])
+
+
+@register("activity-hours", "figure", ("activity",), {"names": "fig-species-list-1"})
+def plot_activity_hours(tables, names=None):
+    return figures.plot_activity_hours(tables["activity"], names)
+
+
+@register(
+    "presence-absence",
+    "figure",
+    ("occupancy",),
+    {"name": "fig-species-list-2"},
+    zoom=True,
+)
+def plot_presence_absence(tables, name=None, x_range=None, y_range=None):
+    return figures.plot_presence_absence(
+        tables["occupancy"], name, x_range, y_range
+    )
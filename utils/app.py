@@ -1,8 +1,25 @@
 """
 
 """
+import pathlib
+
 import dash
 import dash_bootstrap_components as dbc
 
-app = dash.Dash(external_stylesheets=[dbc.themes.MATERIA, dbc.icons.FONT_AWESOME])
+from utils import cache, export, jobs, metrics, upload, video
+
+app = dash.Dash(
+    assets_folder=pathlib.Path(__file__).parents[1].joinpath("assets").as_posix(),
+    external_stylesheets=[dbc.themes.MATERIA, dbc.icons.FONT_AWESOME],
+    background_callback_manager=jobs.manager,
+)
 app.title = "WankiUp"
+# Static assets (such as the logos) are cached by the browser for a day.
+app.server.config["SEND_FILE_MAX_AGE_DEFAULT"] = 24 * 60 * 60
+
+upload.register_routes(app.server)
+export.register_routes(app.server)
+video.register_routes(app.server)
+metrics.register_routes(
+    app.server, caches={"projects": cache.projects.stats, "results": cache.results.stats}
+)
@@ -0,0 +1,341 @@
+"""
+Server-side caches for parsed projects and analysis results. The
+browser only holds the key of a project; its tables and derived
+structures never leave the server and are cached separately, so each
+callback only loads what it uses.
+"""
+import collections
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import sys
+import threading
+import uuid
+
+import numpy as np
+
+from utils import derived, ingest, lazy, metrics, reference
+
+pd = lazy.Module("pandas")
+
+
+def _objects_nbytes(series, sample_size=1000):
+    # Size of the objects (e.g. strings) a column points to, estimated
+    # from an evenly spaced sample, since measuring each one of them takes
+    # seconds with millions of rows.
+    sample = series.iloc[:: max(series.size // sample_size, 1)]
+    if sample.empty:
+        return 0
+    nbytes = sample.memory_usage(index=False, deep=True) - sample.memory_usage(
+        index=False, deep=False
+    )
+
+    return int(nbytes * series.size / sample.size)
+
+
+def _nbytes(value):
+    """
+    Approximates the size (in bytes) of a cached value.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum()) + sum(
+            _objects_nbytes(value[column])
+            for column in value.columns[value.dtypes == object]
+        )
+    elif isinstance(value, pd.Series):
+        nbytes = int(value.memory_usage(index=True))
+        if value.dtype == object:
+            nbytes += _objects_nbytes(value)
+        return nbytes
+    elif isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    elif isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    elif isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    elif isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    elif isinstance(value, (str, bytes, int, float, type(None))):
+        return sys.getsizeof(value)
+    else:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache bounded by the total size (in
+    bytes) of the values it holds. The most recently inserted value is
+    always kept, even if it exceeds the limit on its own.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = collections.OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self.pop(key)
+            size = _nbytes(value)
+            self._items[key] = value
+            self._sizes[key] = size
+            self.nbytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self.nbytes -= self._sizes.pop(key)
+            return self._items.pop(key)
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self._items) > 1:
+            key = next(iter(self._items))
+            self.evicted(key, self.pop(key))
+
+    def evicted(self, key, value):
+        """
+        Called with every value evicted from the cache.
+        """
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self), "bytes": self.nbytes}
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+
+class ResultCache(LRUCache):
+    """
+    LRU cache of analysis results with hit and miss counters. If
+    spill_dir is given, evicted results are pickled to disk (bounded by
+    max_disk_bytes) and brought back into memory on their next hit.
+    """
+
+    def __init__(self, max_bytes, spill_dir=None, max_disk_bytes=2**32):
+        super().__init__(max_bytes)
+        self.spill_dir = pathlib.Path(spill_dir) if spill_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return self.spill_dir.joinpath(f"{key}.pkl")
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = super().get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+        if self.spill_dir is not None:
+            try:
+                with open(self._path(key), "rb") as f:
+                    value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                    super().put(key, value)
+                return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value, spill=False):
+        """
+        Stores a result. If spill is True, the result is also written to
+        disk right away so that other processes can read it.
+        """
+        super().put(key, value)
+        if spill:
+            self.spill(key, value)
+
+    def evicted(self, key, value):
+        self.spill(key, value)
+
+    def spill(self, key, value):
+        if self.spill_dir is None:
+            return
+        self.spill_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        path = self._path(key)
+        if not path.exists():
+            # Temporary names are unique across the processes and threads
+            # of the app, which may spill the same result at once.
+            tmp = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp.replace(path)
+        self._prune()
+
+    def _prune(self):
+        files = [(f.stat(), f) for f in self.spill_dir.glob("*.pkl")]
+        total = sum(stat.st_size for stat, _ in files)
+        for stat, f in sorted(files, key=lambda item: item[0].st_mtime):
+            if total <= self.max_disk_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self),
+                "bytes": self.nbytes,
+            }
+
+
+max_bytes = int(os.environ.get("WANKI_PROJECT_CACHE_MB", 2048)) * 2**20
+
+projects = LRUCache(max_bytes)
+
+# Spilled results are unpickled, so they are kept in a folder of the
+# user (not a shared temporary one) and spilling is turned off by setting
+# WANKI_RESULT_SPILL_DIR to an empty string.
+results = ResultCache(
+    int(os.environ.get("WANKI_RESULT_CACHE_MB", 512)) * 2**20,
+    spill_dir=os.environ.get(
+        "WANKI_RESULT_SPILL_DIR", pathlib.Path.home().joinpath(".wanki", "results")
+    ),
+)
+
+
+def _load_project(key, names):
+    # Duplicates are removed from the cached tables of the stored project,
+    # with the gaps between its images computed once, so that changing
+    # the interval neither loads nor sorts them again.
+    digest, _, interval = key.partition(":")
+    if not interval:
+        return ingest.load_project(key, names)
+    tables = get_tables({"key": digest}, [*names, "metadata"])
+    if tables is not None and "images" in tables:
+        gaps = get_derived(
+            {"key": digest},
+            "duplicate-gaps",
+            lambda tables: derived.compute_duplicate_gaps(tables["images"]),
+            ("images",),
+        )
+        tables["images"] = ingest.remove_duplicates(
+            tables["images"], int(interval), gaps
+        )
+
+    return tables
+
+
+def get_tables(data, names):
+    """
+    Retrieves (some of) the tables of a project given the contents of the
+    browser-side store. Tables that are not in memory are loaded from the
+    on-disk storage. Returns None if the project is not available.
+    """
+    if not data or not data.get("key"):
+        return None
+
+    key = data["key"]
+    tables = {
+        name: projects.get((key, name)) for name in names if name != "reference"
+    }
+    missing = [name for name, table in tables.items() if table is None]
+    if missing:
+        loaded = ingest.load_tables(key, missing, _load_project)
+        if loaded is None:
+            return None
+        for name in missing:
+            tables[name] = loaded[name]
+            projects.put((key, name), loaded[name])
+    # The reference table is shared by every project instead of being
+    # cached once per project.
+    if "reference" in names:
+        tables["reference"] = reference.get()
+
+    return tables
+
+
+def _update_derived(data, name, update, dependencies):
+    # The structures of a project appended to another one are updated
+    # from those of the latter, if they are cached, with the appended
+    # images only.
+    tables = get_tables(data, ("metadata",))
+    base = ingest.get_base(data["key"], tables["metadata"]) if tables else None
+    if base is None:
+        return None
+    base_key, nimages = base
+    previous = projects.get((base_key, name))
+    if previous is None:
+        return None
+    tables = get_tables(data, dependencies)
+    if tables is None:
+        return None
+    with metrics.measure("derived", f"{name}:update"):
+        return update(previous, tables, tables["images"].iloc[nimages:])
+
+
+def get_derived(data, name, function, dependencies, update=None):
+    """
+    Retrieves a structure derived from the tables of a project, computing
+    it with function(tables) the first time it is requested, or updating
+    that of the project it was appended to with
+    update(value, tables, images) when available. Returns None if the
+    project is not available.
+    """
+    key = (data["key"], name)
+    value = projects.get(key)
+    if value is None and update is not None:
+        value = _update_derived(data, name, update, dependencies)
+        if value is not None:
+            projects.put(key, value)
+    if value is None:
+        tables = get_tables(data, dependencies)
+        if tables is None:
+            return None
+        with metrics.measure("derived", name):
+            value = function(tables)
+        projects.put(key, value)
+
+    return value
+
+
+def get_result_key(key, id_, params):
+    """
+    Gets the key of the result of an analysis given the key of the
+    project and the parameters of the analysis. Parameters are
+    normalized so that equivalent values share the same result.
+    """
+    params = {
+        name: value.strip() if isinstance(value, str) else value
+        for name, value in params.items()
+        if value is not None
+    }
+    blob = json.dumps([key, id_, params], sort_keys=True, default=str)
+
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
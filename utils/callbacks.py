@@ -1,124 +1,112 @@
 """
 """
-import base64
-import io
+import datetime
 import pathlib
-from zipfile import ZipFile
-
-import cv2
-import dash
-import numpy as np
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import wiutils
-from dash.dependencies import Output, Input, State
-from scipy.stats.kde import gaussian_kde
-
-
-def _plot_accumulation_curve(images, deployments):
-    images = images.copy()
-    images["timestamp"] = pd.to_datetime(images["timestamp"])
-    images["date"] = pd.to_datetime(images["timestamp"].dt.date)
-    start = pd.to_datetime(deployments["start_date"]).min()
-    end = pd.to_datetime(deployments["end_date"]).max()
-    date_range = pd.date_range(start, end, freq="D")
-    df = pd.DataFrame(
-        {"date": date_range, "day": np.arange(date_range.size), "richness": 0}
-    )
-    for i, row in df.iterrows():
-        date = row["date"]
-        subdf = images[images["date"] <= date]
-        richness = subdf["scientific_name"].unique().size
-        row["richness"] = richness
-        df.loc[i] = row
-
-    fig = px.line(
-        df, x="day", y="richness", labels={"day": "Día", "richness": "Riqueza"}
-    )
+from zipfile import BadZipFile
 
-    return fig
+from dash.dependencies import Output, Input, State
+from dash.exceptions import PreventUpdate
 
+from utils import (
+    analyses,
+    cache,
+    export,
+    figures,
+    ingest,
+    metrics,
+    paging,
+    upload,
+    video,
+)
 
-def _plot_site_dates(deployments):
-    deployments = deployments.copy()
-    deployments["start_date"] = pd.to_datetime(deployments["start_date"])
-    deployments["end_date"] = pd.to_datetime(deployments["end_date"])
 
-    df = pd.melt(
-        deployments, id_vars="deployment_id", value_vars=["start_date", "end_date"]
-    )
+def _register_analysis(app, id_, analysis):
+    """
+    Registers the callback of an analysis. Only the store and the
+    parameters the analysis declares are sent with each click.
+    """
+    outputs = [
+        Output("table-result", "data", allow_duplicate=True),
+        Output("data-table", "columns", allow_duplicate=True),
+        Output("data-table", "page_current", allow_duplicate=True),
+        Output("data-table", "sort_by", allow_duplicate=True),
+        Output("data-table", "filter_query", allow_duplicate=True),
+        Output("data-table-wrapper", "style", allow_duplicate=True),
+        Output("graph", "figure", allow_duplicate=True),
+        Output("graph-wrapper", "style", allow_duplicate=True),
+        Output("figure-result", "data", allow_duplicate=True),
+    ]
+    inputs = [Input(id_, "n_clicks"), State("store", "data")]
+    inputs += [
+        State(component_id, "value") for component_id in analysis["params"].values()
+    ]
 
-    df = df.sort_values(["value"], ascending=True)
+    @metrics.timed("callback", id_)
+    def execute(data, values, set_progress=None):
+        params = dict(zip(analysis["params"], values))
+        if set_progress is not None:
+            set_progress((50, "Ejecutando"))
+        result, _ = analyses.run_cached(id_, data, **params)
+        if result is None:
+            return None, None, 0, [], "", {}, {}, {}, None
+        if set_progress is not None:
+            set_progress((90, "Preparando"))
 
-    fig = px.line(
-        df,
-        x="value",
-        y="deployment_id",
-        color="deployment_id",
-        color_discrete_sequence=["#636EFA"],
-        labels={"value": "Fecha", "deployment_id": "Evento"},
-    )
+        if analysis["kind"] == "table":
+            # Only the id and parameters of the result are sent back; its
+            # pages are served from the cache by update_table_page.
+            table_result = {"id": id_, "params": params}
+            table_style = {"display": "block"}
+            figure_style = {"display": "none"}
+            columns = paging.get_columns(result)
+            fig = {}
+            figure_result = None
+        else:
+            table_result = None
+            table_style = {"display": "none"}
+            figure_style = {"display": "block"}
+            columns = []
+            fig = result
+            # Figures that can be zoomed keep their id and parameters to
+            # be rebuilt by zoom_figure.
+            figure_result = None
+            if analysis["zoom"]:
+                figure_result = {"id": id_, "params": params}
 
-    fig.update_layout(showlegend=False)
-
-    return fig
-
-
-def _plot_activity_hours(images, names):
-
-    images = images.copy()
-    images["hour"] = pd.to_datetime(images["timestamp"]).dt.round("H").dt.hour
-    df = pd.DataFrame(columns=["x", "y", "name"])
-    x_range = np.linspace(0, 24, 1000)
-    for name in names:
-        hours = images[images["scientific_name"] == name]["hour"].to_numpy()
-        if np.unique(hours).size > 1:
-            kde = gaussian_kde(hours)       
-            df = pd.concat([df, 
-                            pd.DataFrame(
-                    {"x": x_range, "y": kde(x_range), "name": [name] * x_range.size}
-                )
-                            ], 
-                            ignore_index=True)
-    if not df.empty:
-        fig = px.line(
-            df, x="x", y="y", color="name", labels={"x": "Hora", "y": "Densidad"}
+        return (
+            table_result,
+            columns,
+            0,
+            [],
+            "",
+            table_style,
+            fig,
+            figure_style,
+            figure_result,
         )
-        ticks = [i for i in range(0, 25) if i % 2 == 0]
-        fig.update_layout(
-            xaxis=dict(
-                tickmode="array",
-                tickvals=ticks,
-                ticktext=list(map(lambda x: f"{str(x).zfill(2)}:00", ticks)),
-            ),
-            legend_title_text="",
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-        )
-    else:
-        fig = go.Figure()
-    return fig
 
+    if analysis["background"]:
 
-def _plot_presence_absence(images, deployments, name):
-    images = images.copy()
-    images = images[images["scientific_name"] == name]
-    images["timestamp"] = pd.to_datetime(images["timestamp"])
-    images["date"] = pd.to_datetime(images["timestamp"].dt.date)
-    start = pd.to_datetime(deployments["start_date"]).min()
-    end = pd.to_datetime(deployments["end_date"]).max()
-    date_range = pd.date_range(start, end, freq="D")
-    deployment_ids = sorted(deployments["deployment_id"].unique())
-    df = pd.DataFrame(index=deployment_ids, columns=np.arange(date_range.size))
-    for id_ in deployment_ids:
-        subdf = images[images["deployment_id"] == id_]
-        if subdf.empty:
-            df.loc[id_] = 0
-        df.loc[id_] = date_range.isin(subdf["date"]).astype(int)
+        @app.callback(
+            *outputs,
+            *inputs,
+            background=True,
+            progress=[Output("job-progress", "value"), Output("job-progress", "label")],
+            running=[
+                (Output("job-progress", "style"), {"display": "flex"}, {"display": "none"}),
+                (Output("cancel-job", "disabled"), False, True),
+            ],
+            cancel=[Input("cancel-job", "n_clicks")],
+            prevent_initial_call=True,
+        )
+        def execute_background(set_progress, n_clicks, data, *values):
+            return execute(data, values, set_progress)
 
-    fig = px.imshow(df, labels={"x": "Día", "y": "Evento", "color": "Presencia"})
+    else:
 
-    return fig
+        @app.callback(*outputs, *inputs, prevent_initial_call=True)
+        def execute_foreground(n_clicks, data, *values):
+            return execute(data, values)
 
 
 def generate_callbacks(app):
@@ -135,47 +123,54 @@ def generate_callbacks(app):
         Output("fig-species-list-2", "options"),
         Output("data-check", "className"),
         Output("data-check-tooltip", "style"),
-        Input("upload", "contents"),
-        State("upload", "filename"),
+        Input("upload-file", "data"),
         State("remove-duplicates", "value"),
         State("remove-duplicates-interval", "value"),
-
+        State("update-project", "value"),
+        State("store", "data"),
     )
-    def store_project(content, name, remove_duplicates, remove_duplicates_interval):
-        if content is not None:
-            string = content.split(",")[1]
-            decoded = base64.b64decode(string)
-            z = ZipFile(io.BytesIO(decoded))
-            stem = pathlib.Path(name).stem
+    @metrics.timed("callback")
+    def store_project(
+        upload_file,
+        remove_duplicates,
+        remove_duplicates_interval,
+        update_project,
+        data,
+    ):
+        if upload_file is not None:
+            # Several archives are combined into a single dataset.
+            paths = [upload.get_upload_path(item["id"]) for item in upload_file]
+            interval = remove_duplicates_interval if remove_duplicates else None
             try:
-                images = pd.read_csv(io.BytesIO(z.read(f"{stem}/images.csv")))
-                nimages_all = images.shape[0]
-                images = wiutils.remove_unidentified(images, rank="genus")
-                images["scientific_name"] = wiutils.get_scientific_name(
-                    images, keep_genus=True, add_qualifier=True
-                )
-                if remove_duplicates and remove_duplicates_interval:
-                    images = wiutils.remove_duplicates(
-                        images, interval=remove_duplicates_interval, unit="minutes"
+                if not paths or None in paths:
+                    raise KeyError("The upload does not exist.")
+                if update_project and data and len(paths) == 1:
+                    # A newer export of the loaded project only adds its
+                    # new images.
+                    key = ingest.update_project(paths[0], data["key"], interval)
+                else:
+                    key = ingest.combine_keys(
+                        ingest.open_project(path, interval) for path in paths
                     )
-                deployments = pd.read_csv(io.BytesIO(z.read(f"{stem}/deployments.csv")))
-                projects = pd.read_csv(io.BytesIO(z.read(f"{stem}/projects.csv")))
-            except KeyError:
-                return None, "", "", "", [], [], "fas fa-times-circle", {"display": "float"}
-            reference = pd.read_csv(
-                pathlib.Path(__file__)
-                .parents[1]
-                .joinpath("assets/reference.csv")
-                .as_posix()
+                data = {"key": key}
+            except (KeyError, BadZipFile):
+                return None, "", "", "", "", [], [], "fas fa-times-circle", {"display": "float"}
+            finally:
+                for path in paths:
+                    if path is not None:
+                        path.unlink(missing_ok=True)
+            tables = cache.get_tables(
+                data, ("images", "deployments", "projects", "metadata")
             )
-            data = {
-                "images": images.to_json(orient="split"),
-                "deployments": deployments.to_json(orient="split"),
-                "projects": projects.to_json(orient="split"),
-                "reference": reference.to_json(orient="split"),
-            }
-            name = projects.loc[0, "project_name"]
-            sites = pd.read_json(data["deployments"], orient="split").shape[0]
+            images = tables["images"]
+            deployments = tables["deployments"]
+            projects = tables["projects"]
+            nimages_all = tables["metadata"]["nimages_all"]
+            if projects.shape[0] == 1:
+                name = projects.loc[0, "project_name"]
+            else:
+                name = f"{projects.shape[0]} proyectos"
+            sites = deployments.shape[0]
             nimages = images.shape[0]
             options = [
                 {"label": name, "value": name}
@@ -184,198 +179,250 @@ def generate_callbacks(app):
 
             return data, name, sites, nimages_all, nimages, options, options, "fas fa-check-circle", {"display": "none"}
         else:
-            return None, "", "", "", [], [], "", {}
+            return None, "", "", "", "", [], [], "", {}
+
+    @app.callback(
+        Output("store", "data", allow_duplicate=True),
+        Output("project-images", "children", allow_duplicate=True),
+        Input("remove-duplicates", "value"),
+        Input("remove-duplicates-interval", "value"),
+        State("store", "data"),
+        prevent_initial_call=True,
+    )
+    @metrics.timed("callback")
+    def update_duplicates(remove_duplicates, remove_duplicates_interval, data):
+        # Duplicates of the loaded dataset are removed again (from its
+        # cached images) when the interval changes, without uploading it.
+        if not data or (remove_duplicates and remove_duplicates_interval is None):
+            raise PreventUpdate
+        interval = remove_duplicates_interval if remove_duplicates else None
+        data = {"key": ingest.set_interval(data["key"], interval)}
+        tables = cache.get_tables(data, ("images",))
+        if tables is None:
+            raise PreventUpdate
+
+        return data, tables["images"].shape[0]
+
     # Video
     @app.callback(
-        Output("store", "video"),
+        Output("video-table", "data"),
+        Output("video-table-wrapper", "style"),
         Output("video-name", "children"),
         Output("video-seconds", "children"),
         Output("video-frames", "children"),
         Output("video-check", "className"),
         Output("video-check-tooltip", "style"),
-        Input("video-upload", "contents"),
-        State("video-upload", "filename"),
+        Input("video-upload-file", "data"),
+        State("video-table", "data"),
+        State("session-id", "data"),
     )
-    def store_video(content, name):
-        if content is not None:
-            string = content.split(",")[1]
-            decoded = base64.b64decode(string)
-            bytesio_object = io.BytesIO(decoded)
-            with open("video.MP4", "wb") as f:
-                f.write(bytesio_object.getbuffer())      
-            
-            try:
-                video = cv2.VideoCapture("video.MP4")  
-            except KeyError:
-                return None, "", "", "", "fas fa-times-circle", {"display": "float"}
-            
-            frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-            seconds = int(frames/video.get(cv2.CAP_PROP_FPS))
-            print('here123')
-            print(name, frames, seconds)
-            return '', name, seconds, frames, "fas fa-check-circle", {"display": "none"}
+    @metrics.timed("callback")
+    def store_video(upload_file, rows, session_id):
+        if upload_file is not None:
+            stored = []
+            for item in upload_file:
+                path = upload.get_upload_path(item["id"])
+                if path is None:
+                    continue
+                modified = None
+                if item.get("modified"):
+                    modified = datetime.datetime.fromtimestamp(item["modified"] / 1000)
+                try:
+                    stored += video.store_videos(
+                        session_id, path, item["filename"], modified
+                    )
+                except (BadZipFile, OSError, ValueError):
+                    path.unlink(missing_ok=True)
+            new_rows = video.describe_videos(session_id, stored)
+            rows = (rows or []) + new_rows
+            if new_rows:
+                check = "fas fa-check-circle", {"display": "none"}
+            else:
+                check = "fas fa-times-circle", {"display": "float"}
+            seconds = round(sum(row["seconds"] for row in rows))
+            frames = sum(row["frames"] for row in rows)
+            style = {"display": "block"} if rows else {"display": "none"}
+
+            return rows, style, len(rows), seconds, frames, *check
         else:
-            return None, "", "", "", [], [], "", {}
+            return [], {"display": "none"}, "", "", "", "", {}
+
+    @app.callback(
+        Output("video-table", "dropdown"),
+        Input("store", "data"),
+        Input("video-table", "data"),
+    )
+    @metrics.timed("callback")
+    def update_video_deployments(data, rows):
+        deployment_ids = set()
+        tables = cache.get_tables(data, ("deployments",))
+        if tables is not None:
+            deployment_ids.update(tables["deployments"]["deployment_id"].astype(str))
+        deployment_ids.update(row["deployment_id"] for row in rows or [])
+        deployment_ids.discard(None)
+        options = [{"label": i, "value": i} for i in sorted(deployment_ids)]
+
+        return {"deployment_id": {"options": options}}
+
+    @app.callback(
+        Output("convert-video-report", "children"),
+        Output("convert-video-download", "href"),
+        Output("convert-video-download", "style"),
+        Input("convert-video-to-image", "n_clicks"),
+        State("video-table", "data"),
+        State("session-id", "data"),
+        State("offset-seconds", "value"),
+        State("convert-video-motion", "value"),
+        State("convert-video-motion-area", "value"),
+        background=True,
+        progress=[Output("job-progress", "value"), Output("job-progress", "label")],
+        running=[
+            (Output("job-progress", "style"), {"display": "flex"}, {"display": "none"}),
+            (Output("cancel-job", "disabled"), False, True),
+        ],
+        cancel=[Input("cancel-job", "n_clicks")],
+        prevent_initial_call=True,
+    )
+    @metrics.timed("callback")
+    def convert_video(
+        set_progress, n_clicks, rows, session_id, offset_seconds, motion, motion_area
+    ):
+        paths = []
+        names = []
+        for row in rows or []:
+            path = video.get_video_path(session_id, row["id"])
+            if path is None:
+                continue
+            # Frames are grouped by deployment inside the archive.
+            stem = pathlib.PurePath(row["filename"]).stem
+            name = f"{row['deployment_id'] or 'sin_evento'}/{stem}"
+            if name in names:
+                name = f"{name}_{row['id'][:8]}"
+            paths.append(path)
+            names.append(name)
+        if not paths or not offset_seconds:
+            return "", None, {"display": "none"}
+
+        output = video.new_frames_path(session_id)
+        report = video.extract_frames(
+            paths,
+            output,
+            interval=offset_seconds,
+            names=names,
+            min_area=(motion_area or 0) / 100 if motion else None,
+            progress=lambda done, total: set_progress(
+                (int(100 * done / total), f"{done}/{total}")
+            ),
+        )
+        frames = f"{report['frames']} imágenes"
+        if motion:
+            frames = (
+                f"{report['frames']} de {report['sampled']} imágenes con movimiento"
+            )
+        text = (
+            f"{frames} de {report['videos']} videos en {report['seconds']:.1f} s "
+            f"({report['frames_per_second']:.1f} imágenes/s)"
+        )
+
+        return text, video.get_frames_url(session_id, output), {"display": "block"}
+
+    for id_, analysis in analyses.ANALYSES.items():
+        _register_analysis(app, id_, analysis)
 
     @app.callback(
-        Output("data-table", "columns"),
         Output("data-table", "data"),
-        Output("data-table-wrapper", "style"),
-        Output("graph", "figure"),
-        Output("graph-wrapper", "style"),
-        Input("general-count", "n_clicks"),
-        Input("dwc-events", "n_clicks"),
-        Input("dwc-records", "n_clicks"),
-        Input("deployment-detection", "n_clicks"),
-        Input("detection-history", "n_clicks"),
-        Input("hill-numbers", "n_clicks"),
-        Input("deployment-summary", "n_clicks"),
-        Input("accumulation-curve", "n_clicks"),
-        Input("site-dates", "n_clicks"),
-        Input("activity-hours", "n_clicks"),
-        Input("presence-absence", "n_clicks"),
+        Output("data-table", "page_count"),
+        Input("table-result", "data"),
+        Input("data-table", "page_current"),
+        Input("data-table", "page_size"),
+        Input("data-table", "sort_by"),
+        Input("data-table", "filter_query"),
         State("store", "data"),
-        State("general-count-add-taxonomy", "value"),
-        State("general-count-threat-status", "value"),
-        State("general-count-endemic", "value"),
-        State("dwc-lang", "value"),
-        State("deployment-detection-compute-abundance", "value"),
-        State("deployment-detection-pivot", "value"),
-        State("detection-history-days", "value"),
-        State("detection-history-date-range", "value"),
-        State("detection-history-compute-abundance", "value"),
-        State("detection-history-pivot", "value"),
-        State("hill-numbers-q", "value"),
-        State("hill-numbers-pivot", "value"),
-        State("fig-species-list-1", "value"),
-        State("fig-species-list-2", "value"),
     )
-    def execute(
-        btn1,
-        btn2,
-        btn3,
-        btn4,
-        btn5,
-        btn6,
-        btn7,
-        btn8,
-        btn9,
-        btn10,
-        btn11,
-        data,
-        general_count_add_taxonomy,
-        general_count_threat_status,
-        general_count_endemic,
-        dwc_lang,
-        deployment_detection_compute_abundance,
-        deployment_detection_pivot,
-        detection_history_days,
-        detection_history_date_range,
-        detection_history_compute_abundance,
-        detection_history_pivot,
-        hill_numbers_q,
-        hill_numbers_pivot,
-        names,
-        name,
+    @metrics.timed("callback")
+    def update_table_page(
+        table_result, page_current, page_size, sort_by, filter_query, data
     ):
-        ctx = dash.callback_context
-        if not ctx.triggered:
-            return None, None, {}, {}, {}
-        else:
-            id_ = ctx.triggered[0]["prop_id"].split(".")[0]
-            images = pd.read_json(data["images"], orient="split")
-            deployments = pd.read_json(data["deployments"], orient="split")
-            projects = pd.read_json(data["projects"], orient="split")
-            status = None
-            if id_ == "general-count":
-                status = "table"
-                reference = pd.read_json(data["reference"], orient="split")
-                reference = reference.rename(
-                    columns={
-                        "scientificName": "scientific_name",
-                        "threatStatus": "threat_status",
-                        "establishmentMeans": "establishment_means",
-                    }
-                )
-                result = wiutils.compute_general_count(
-                    images, add_taxonomy=True#bool(general_count_add_taxonomy)
-                )
-                result['scientific_name'] = wiutils.get_scientific_name(result)
-                if bool(general_count_threat_status):
-                    result = pd.merge(
-                        result,
-                        reference[["scientific_name", "threat_status"]],
-                        how="left",
-                        on="scientific_name",
-                    )
-                if bool(general_count_endemic):
-                    result = pd.merge(
-                        result,
-                        reference[["scientific_name", "establishment_means"]],
-                        how="left",
-                        on="scientific_name",
-                    )
-            elif id_ == "dwc-events":
-                status = "table"
-                result = wiutils.create_dwc_event(
-                    deployments, projects,
-                    )
-            elif id_ == "dwc-records":
-                status = "table"
-                result = wiutils.create_dwc_occurrence(
-                    images, deployments, projects,
-                    )
-            elif id_ == "deployment-detection":
-                status = "table"
-                result = wiutils.compute_detection(
-                    images,
-                    compute_abundance=deployment_detection_compute_abundance,
-                    pivot=deployment_detection_pivot,
-                )
-            elif id_ == "detection-history":
-                status = "table"
-                result = wiutils.compute_detection_history(
-                    images,
-                    deployments,
-                    date_range=detection_history_date_range,
-                    days=detection_history_days,
-                    compute_abundance=detection_history_compute_abundance,
-                    pivot=detection_history_pivot,
-                )
-            elif id_ == "hill-numbers":
-                status = "table"
-                q_values = list(map(lambda x: int(x), hill_numbers_q.split(",")))
-                result = wiutils.compute_hill_numbers(
-                    images, q_values=q_values, pivot=hill_numbers_pivot
-                )
-            elif id_ == "deployment-summary":
-                status = "table"
-                result = wiutils.compute_count_summary(images)
-            elif id_ == "accumulation-curve":
-                status = "figure"
-                fig = _plot_accumulation_curve(images, deployments)
-            elif id_ == "site-dates":
-                status = "figure"
-                fig = _plot_site_dates(deployments)
-            elif id_ == "activity-hours":
-                status = "figure"
-                fig = _plot_activity_hours(images, names)
-            elif id_ == "presence-absence":
-                status = "figure"
-                fig = _plot_presence_absence(images, deployments, name)
-            else:
-                return None, None, {}, {}, {}
-
-            if status == "table":
-                table_style = {"display": "block"}
-                figure_style = {"display": "none"}
-                columns = [{"name": i, "id": i} for i in result.columns]
-                data = result.to_dict("records")
-                fig = {}
-            elif status == "figure":
-                table_style = {"display": "none"}
-                figure_style = {"display": "block"}
-                columns = []
-                data = []
-
-            return columns, data, table_style, fig, figure_style
\ No newline at end of file
+        if table_result is None:
+            return [], None
+        result, _ = analyses.run_cached(
+            table_result["id"], data, **table_result["params"]
+        )
+        if result is None:
+            return [], None
+
+        return paging.get_page(
+            result, page_current or 0, page_size, sort_by, filter_query
+        )
+
+    @app.callback(
+        Output("graph", "figure", allow_duplicate=True),
+        Output("figure-result", "data", allow_duplicate=True),
+        Input("graph", "relayoutData"),
+        State("figure-result", "data"),
+        State("store", "data"),
+        prevent_initial_call=True,
+    )
+    @metrics.timed("callback")
+    def zoom_figure(relayout_data, figure_result, data):
+        # Figures are re-aggregated over the visible window when zoomed in
+        # (or panned) and over the whole figure when zoomed out.
+        if figure_result is None or not relayout_data:
+            raise PreventUpdate
+        ranges = figures.update_ranges(figure_result.get("ranges"), relayout_data)
+        if ranges == figure_result.get("ranges", {}):
+            raise PreventUpdate
+        fig = analyses.run(
+            figure_result["id"], data, **figure_result["params"], **ranges
+        )
+        if fig is None:
+            raise PreventUpdate
+
+        return fig, {**figure_result, "ranges": ranges}
+
+    @app.callback(
+        Output("export-menu", "disabled"),
+        *[
+            Output(f"export-{format_.replace('.', '-')}", "href")
+            for format_ in export.FORMATS
+        ],
+        Input("table-result", "data"),
+        Input("data-table", "sort_by"),
+        Input("data-table", "filter_query"),
+        State("store", "data"),
+    )
+    @metrics.timed("callback")
+    def update_export_links(table_result, sort_by, filter_query, data):
+        if table_result is None or data is None:
+            return True, *[None for _ in export.FORMATS]
+
+        return False, *[
+            export.get_url(format_, data, table_result, sort_by, filter_query)
+            for format_ in export.FORMATS
+        ]
+
+    @app.callback(
+        Output("diagnostics", "is_open"),
+        Input("diagnostics-button", "n_clicks"),
+        State("diagnostics", "is_open"),
+        prevent_initial_call=True,
+    )
+    def toggle_diagnostics(n_clicks, is_open):
+        return not is_open
+
+    @app.callback(
+        Output("diagnostics-table", "data"),
+        Output("diagnostics-interval", "disabled"),
+        Input("diagnostics", "is_open"),
+        Input("diagnostics-interval", "n_intervals"),
+    )
+    def update_diagnostics(is_open, n_intervals):
+        if not is_open:
+            return [], True
+        summary = metrics.summarize()
+        for column in ("peak_memory", "bytes_in", "bytes_out"):
+            summary[column] = summary[column] / 2**20
+        numeric = summary.select_dtypes("number").columns
+        summary[numeric] = summary[numeric].round(3)
+
+        return summary.to_dict("records"), False
@@ -0,0 +1,337 @@
+"""
+Vectorized structures derived from the tables of a project and used to
+build the figures.
+"""
+import numpy as np
+
+from utils import lazy
+
+pd = lazy.Module("pandas")
+
+
+def get_date_range(deployments):
+    """
+    Gets the daily date range spanned by the deployments of a project.
+    """
+    start = pd.to_datetime(deployments["start_date"]).min()
+    end = pd.to_datetime(deployments["end_date"]).max()
+
+    return pd.date_range(start, end, freq="D")
+
+
+def encode_species(images):
+    """
+    Encodes the scientific names of the images as a categorical with
+    only the species present in them.
+    """
+    return pd.Categorical(images["scientific_name"]).remove_unused_categories()
+
+
+def get_day_offsets(images, start):
+    """
+    Gets the number of days between the date of each image and start.
+    """
+    dates = pd.to_datetime(images["timestamp"]).dt.normalize()
+
+    return (dates - start).dt.days.to_numpy()
+
+
+def compute_duplicate_gaps(images):
+    """
+    Computes the time (in seconds) elapsed between each image and the
+    previous one of the same species in the same deployment, sorting
+    them once. The first image of each species in each deployment (and
+    those without species or timestamp) get an infinite gap.
+    """
+    timestamps = pd.to_datetime(images["timestamp"])
+    missing = (timestamps.isna() | images["scientific_name"].isna()).to_numpy()
+    seconds = timestamps.to_numpy().astype("datetime64[s]").astype(np.int64)
+    deployments = pd.Categorical(images["deployment_id"]).codes
+    species = encode_species(images).codes
+
+    order = np.lexsort((seconds, species, deployments))
+    same = (np.diff(deployments[order]) == 0) & (np.diff(species[order]) == 0)
+    sorted_gaps = np.full(order.size, np.inf)
+    sorted_gaps[1:][same] = np.diff(seconds[order])[same]
+    gaps = np.empty(order.size)
+    gaps[order] = sorted_gaps
+    gaps[missing] = np.inf
+
+    return gaps
+
+
+def compute_first_dates(images):
+    """
+    Computes the date of the first detection of each species.
+    """
+    images = images.dropna(subset=["scientific_name"])
+    dates = pd.to_datetime(images["timestamp"]).dt.normalize()
+
+    return dates.groupby(images["scientific_name"], observed=True).min()
+
+
+def update_first_dates(first_dates, images):
+    """
+    Updates the date of the first detection of each species with new
+    images.
+    """
+    first_dates = pd.concat([first_dates, compute_first_dates(images)])
+
+    return first_dates.groupby(level=0).min()
+
+
+def compute_first_detections(images, date_range, first_dates=None):
+    """
+    Computes the day offset (relative to the start of date_range) of
+    the first detection of each species, from the dates of the first
+    detections when already computed. Species detected before the start
+    of the range are assigned to the first day.
+    """
+    if first_dates is None:
+        first_dates = compute_first_dates(images)
+
+    return (first_dates - date_range[0]).dt.days.clip(lower=0)
+
+
+def compute_accumulation(first_detections, ndays):
+    """
+    Computes the cumulative number of species detected per day given the
+    day offset of their first detection.
+    """
+    offsets = first_detections.to_numpy()
+    offsets = offsets[offsets < ndays]
+    counts = np.bincount(offsets, minlength=ndays)
+
+    return np.cumsum(counts)
+
+
+def compute_random_accumulation(
+    images, date_range, permutations=100, seed=None, max_elements=2**24
+):
+    """
+    Computes species accumulation curves for random orderings of the
+    sampling days. Returns an array of shape (permutations, days) with
+    the cumulative richness of each permutation.
+
+    The curves are computed in batches of permutations so that at most
+    max_elements positions are held in memory at once.
+    """
+    ndays = date_range.size
+    images = images.dropna(subset=["scientific_name"])
+    days = get_day_offsets(images, date_range[0])
+    mask = (days >= 0) & (days < ndays)
+    species = encode_species(images[mask]).codes
+    pairs = np.unique(np.stack([species, days[mask]]), axis=1)
+    if pairs.shape[1] == 0:
+        return np.zeros((permutations, ndays), dtype=int)
+
+    # Detections are sorted by species, so the first detection of each
+    # species in a given ordering is the minimum over its segment.
+    starts = np.flatnonzero(np.r_[True, np.diff(pairs[0]) != 0])
+
+    rng = np.random.default_rng(seed)
+    batch = max(1, max_elements // max(pairs.shape[1], ndays))
+    curves = []
+    for size in np.diff(np.r_[np.arange(0, permutations, batch), permutations]):
+        order = rng.permuted(np.tile(np.arange(ndays), (size, 1)), axis=1)
+        positions = np.argsort(order, axis=1)
+        first = np.minimum.reduceat(positions[:, pairs[1]], starts, axis=1)
+        first += np.arange(size)[:, np.newaxis] * ndays
+        counts = np.bincount(first.ravel(), minlength=size * ndays)
+        curves.append(np.cumsum(counts.reshape(size, ndays), axis=1))
+
+    return np.concatenate(curves)
+
+
+def _unique_triplets(species, rows, cols, shape):
+    # Unique (species, row, column) triplets sorted by species, sorting a
+    # single integer key per triplet instead of the columns of an array.
+    keys = np.unique(np.ravel_multi_index((species, rows, cols), shape))
+
+    return np.unravel_index(keys, shape)
+
+
+def build_occupancy(images, deployments):
+    """
+    Builds a sparse deployment x day x species occupancy cube. Unique
+    detections are stored sorted by species, with indptr delimiting the
+    segment of each species, so the deployment x day matrix of any
+    species is a slice of the cube.
+    """
+    date_range = get_date_range(deployments)
+    deployment_ids = np.sort(deployments["deployment_id"].unique())
+    images = images.dropna(subset=["scientific_name"])
+    species = encode_species(images)
+
+    rows = pd.Index(deployment_ids).get_indexer(images["deployment_id"])
+    cols = get_day_offsets(images, date_range[0])
+    mask = (rows >= 0) & (cols >= 0) & (cols < date_range.size)
+    triplets = _unique_triplets(
+        species.codes[mask],
+        rows[mask],
+        cols[mask],
+        (species.categories.size, deployment_ids.size, date_range.size),
+    )
+    indptr = np.searchsorted(triplets[0], np.arange(species.categories.size + 1))
+
+    return {
+        "date_range": date_range,
+        "deployment_ids": deployment_ids,
+        "species": pd.Index(species.categories),
+        "indptr": indptr,
+        "rows": triplets[1],
+        "cols": triplets[2],
+    }
+
+
+def update_occupancy(occupancy, images, deployments):
+    """
+    Updates an occupancy cube with new images (and the deployments of the
+    updated project), merging the detections of both instead of
+    rebuilding the cube from every image. Rows and columns of the
+    previous detections are shifted to the new deployments and dates.
+    """
+    new = build_occupancy(images, deployments)
+    species = occupancy["species"].union(new["species"])
+    codes = []
+    for cube in (occupancy, new):
+        counts = np.diff(cube["indptr"])
+        codes.append(np.repeat(species.get_indexer(cube["species"]), counts))
+    rows = pd.Index(new["deployment_ids"]).get_indexer(occupancy["deployment_ids"])[
+        occupancy["rows"]
+    ]
+    cols = occupancy["cols"] + (occupancy["date_range"][0] - new["date_range"][0]).days
+    mask = (rows >= 0) & (cols >= 0) & (cols < new["date_range"].size)
+    triplets = _unique_triplets(
+        np.r_[codes[0][mask], codes[1]],
+        np.r_[rows[mask], new["rows"]],
+        np.r_[cols[mask], new["cols"]],
+        (species.size, new["deployment_ids"].size, new["date_range"].size),
+    )
+
+    return {
+        **new,
+        "species": species,
+        "indptr": np.searchsorted(triplets[0], np.arange(species.size + 1)),
+        "rows": triplets[1],
+        "cols": triplets[2],
+    }
+
+
+def get_bin_edges(start, end, max_bins):
+    """
+    Splits the integer interval [start, end) into at most max_bins bins
+    of (almost) the same size. Returns the edges of the bins.
+    """
+    nbins = max(min(end - start, max_bins), 1)
+
+    return np.unique(np.linspace(start, end, nbins + 1).round().astype(int))
+
+
+def get_presence_absence(
+    occupancy, name, rows=None, cols=None, max_rows=None, max_cols=None
+):
+    """
+    Gets the deployment x day presence/absence matrix of a species from
+    an occupancy cube, within the rows (deployments) and columns (days)
+    given as (start, end) intervals. When the window has more rows or
+    columns than max_rows or max_cols, they are aggregated into bins and
+    each cell holds the share of the deployment days of its bin with
+    presences. Returns the matrix along with the edges of its rows and
+    columns.
+    """
+    nrows = occupancy["deployment_ids"].size
+    ncols = occupancy["date_range"].size
+    row_start, row_end = rows or (0, nrows)
+    col_start, col_end = cols or (0, ncols)
+    row_edges = get_bin_edges(row_start, row_end, max_rows or nrows)
+    col_edges = get_bin_edges(col_start, col_end, max_cols or ncols)
+
+    counts = np.zeros((row_edges.size - 1, col_edges.size - 1))
+    i = occupancy["species"].get_indexer([name])[0]
+    if i >= 0:
+        start, end = occupancy["indptr"][i : i + 2]
+        species_rows = occupancy["rows"][start:end]
+        species_cols = occupancy["cols"][start:end]
+        mask = (
+            (species_rows >= row_edges[0])
+            & (species_rows < row_edges[-1])
+            & (species_cols >= col_edges[0])
+            & (species_cols < col_edges[-1])
+        )
+        np.add.at(
+            counts,
+            (
+                np.searchsorted(row_edges, species_rows[mask], side="right") - 1,
+                np.searchsorted(col_edges, species_cols[mask], side="right") - 1,
+            ),
+            1,
+        )
+    sizes = np.outer(np.diff(row_edges), np.diff(col_edges))
+
+    return counts / sizes, row_edges, col_edges
+
+
+def _count_activity(images, bins):
+    # Detections of each species in each bin of the day.
+    images = images.dropna(subset=["scientific_name"])
+    timestamps = pd.to_datetime(images["timestamp"])
+    minutes = (
+        timestamps.dt.hour * 60 + timestamps.dt.minute + timestamps.dt.second / 60
+    ).to_numpy()
+    positions = (minutes * bins / 1440).astype(int) % bins
+    species = encode_species(images)
+
+    nspecies = species.categories.size
+    counts = np.bincount(
+        species.codes.astype(np.intp) * bins + positions, minlength=nspecies * bins
+    ).reshape(nspecies, bins)
+
+    return pd.Index(species.categories), counts
+
+
+def _smooth_activity(species, counts):
+    bins = counts.shape[1]
+    n = counts.sum(axis=1)
+
+    angles = 2 * np.pi * (np.arange(bins) + 0.5) / bins
+    resultant = np.hypot(counts @ np.cos(angles), counts @ np.sin(angles)) / n
+    sd = np.sqrt(-2 * np.log(np.clip(resultant, 1e-12, 1)))
+    bandwidth = np.clip(1.06 * sd * n ** (-1 / 5), 2 * np.pi / bins, np.pi)
+
+    frequencies = np.arange(bins // 2 + 1)
+    kernel = np.exp(-0.5 * (frequencies * bandwidth[:, np.newaxis]) ** 2)
+    density = np.fft.irfft(np.fft.rfft(counts, axis=1) * kernel, n=bins, axis=1)
+    density = np.clip(density, 0, None) / n[:, np.newaxis] * bins / 24
+
+    return {
+        "hours": (np.arange(bins) + 0.5) * 24 / bins,
+        "species": species,
+        "counts": counts,
+        "density": density,
+    }
+
+
+def compute_activity_densities(images, bins=288):
+    """
+    Computes the circular activity density (per hour) of every species
+    in a single pass. Detection times are binned on a fixed grid over
+    the 24 hours of the day and smoothed with a wrapped normal kernel
+    in the frequency domain. The bandwidth of each species follows
+    Silverman's rule of thumb using its circular standard deviation.
+    """
+    return _smooth_activity(*_count_activity(images, bins))
+
+
+def update_activity_densities(activity, images):
+    """
+    Updates the activity densities with new images, adding their counts
+    to the previous ones and smoothing them again.
+    """
+    species, counts = _count_activity(images, activity["counts"].shape[1])
+    union = activity["species"].union(species)
+    total = np.zeros((union.size, counts.shape[1]), dtype=counts.dtype)
+    total[union.get_indexer(activity["species"])] += activity["counts"]
+    total[union.get_indexer(species)] += counts
+
+    return _smooth_activity(union, total)
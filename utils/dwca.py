@@ -0,0 +1,148 @@
+"""
+Darwin Core archives of Wildlife Insights projects. Each archive holds
+the deployments as events (the core) and the images as occurrences (an
+extension), described by a meta.xml file.
+"""
+import csv
+import io
+import os
+import pathlib
+import time
+import uuid
+from xml.sax.saxutils import quoteattr
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+import wiutils
+
+from utils import ingest
+
+DWC_TERMS = "http://rs.tdwg.org/dwc/terms/"
+
+EVENT_ROW_TYPE = "http://rs.tdwg.org/dwc/terms/Event"
+
+OCCURRENCE_ROW_TYPE = "http://rs.tdwg.org/dwc/terms/Occurrence"
+
+FILES = {"event": "event.txt", "occurrence": "occurrence.txt"}
+
+
+def _describe_file(tag, row_type, location, columns, id_tag, id_column):
+    fields = "\n".join(
+        f"    <field index={quoteattr(str(i))} term={quoteattr(DWC_TERMS + column)}/>"
+        for i, column in enumerate(columns)
+    )
+
+    attributes = " ".join(
+        [
+            'encoding="UTF-8"',
+            'fieldsTerminatedBy="\\t"',
+            'linesTerminatedBy="\\n"',
+            'fieldsEnclosedBy=""',
+            'ignoreHeaderLines="1"',
+            f"rowType={quoteattr(row_type)}",
+        ]
+    )
+
+    return f"""  <{tag} {attributes}>
+    <files>
+      <location>{location}</location>
+    </files>
+    <{id_tag} index="{columns.index(id_column)}"/>
+{fields}
+  </{tag}>"""
+
+
+def create_meta(event_columns, occurrence_columns):
+    """
+    Creates the meta.xml descriptor of an archive with events as its core
+    and occurrences as an extension linked by eventID.
+    """
+    core = _describe_file(
+        "core", EVENT_ROW_TYPE, FILES["event"], event_columns, "id", "eventID"
+    )
+    extension = _describe_file(
+        "extension",
+        OCCURRENCE_ROW_TYPE,
+        FILES["occurrence"],
+        occurrence_columns,
+        "coreid",
+        "eventID",
+    )
+
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<archive xmlns="http://rs.tdwg.org/dwc/text/">
+{core}
+{extension}
+</archive>
+"""
+
+
+def _write_table(z, name, table):
+    # Fields are not enclosed in quotes (as meta.xml declares), so tabs and
+    # line breaks within values are replaced by spaces to keep the rows.
+    text_columns = table.columns[table.dtypes == object]
+    table = table.assign(
+        **{
+            column: table[column].replace(r"[\t\r\n]+", " ", regex=True)
+            for column in text_columns
+        }
+    )
+    info = ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = ZIP_DEFLATED
+    with z.open(info, "w") as f:
+        with io.TextIOWrapper(f, encoding="utf-8", newline="") as text:
+            table.to_csv(
+                text,
+                sep="\t",
+                index=False,
+                lineterminator="\n",
+                quoting=csv.QUOTE_NONE,
+            )
+
+
+def build_archive(path, output_dir, remove_duplicates_interval=None):
+    """
+    Builds the Darwin Core archive of a project archive in output_dir,
+    named after the project archive. Returns a report of the project with
+    the number of records written and the time it took.
+    """
+    start = time.perf_counter()
+    path = pathlib.Path(path)
+    output_dir = pathlib.Path(output_dir)
+
+    images, deployments, projects = ingest.read_project(path)
+    nimages_all = images.shape[0]
+    images = ingest.clean_images(images)
+    if remove_duplicates_interval:
+        images = wiutils.remove_duplicates(
+            images, interval=int(remove_duplicates_interval), unit="minutes"
+        )
+    events = wiutils.create_dwc_event(deployments, projects)
+    occurrences = wiutils.create_dwc_occurrence(images, deployments, projects)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = output_dir.joinpath(f"{path.stem}-dwca.zip")
+    tmp = output_dir.joinpath(f".{path.stem}-{uuid.uuid4().hex}.zip")
+    try:
+        with ZipFile(tmp, "w", compression=ZIP_DEFLATED) as z:
+            _write_table(z, FILES["event"], events)
+            _write_table(z, FILES["occurrence"], occurrences)
+            z.writestr(
+                "meta.xml",
+                create_meta(list(events.columns), list(occurrences.columns)),
+            )
+        os.replace(tmp, output)
+    finally:
+        tmp.unlink(missing_ok=True)
+    seconds = time.perf_counter() - start
+
+    return {
+        "project": path.name,
+        "archive": output.name,
+        "images": nimages_all,
+        "events": events.shape[0],
+        "occurrences": occurrences.shape[0],
+        "seconds": seconds,
+        "occurrences_per_second": occurrences.shape[0] / seconds,
+        "input_mb": path.stat().st_size / 2**20,
+        "output_mb": output.stat().st_size / 2**20,
+    }
@@ -0,0 +1,212 @@
+"""
+Streaming export of result tables. Tables are written in chunks of rows
+and sent to the browser as they are generated, so large exports never
+hold the whole file in memory.
+"""
+import json
+import os
+import re
+import tempfile
+import urllib.parse
+import zlib
+
+import flask
+
+from utils import analyses, lazy, paging
+
+openpyxl = lazy.Module("openpyxl")
+
+pa = lazy.Module("pyarrow")
+
+pq = lazy.Module("pyarrow.parquet")
+
+FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "xlsx": (
+        "xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+}
+
+# Key of a project or of several combined projects (see ingest.get_key).
+KEY_PATTERN = r"[0-9a-f]{64}(:[0-9]+)?(\+[0-9a-f]{64}(:[0-9]+)?)*"
+
+chunk_size = 50_000
+
+read_size = 2**20
+
+# Excel sheets hold up to 2^20 rows, one of them used by the header.
+max_sheet_rows = 2**20 - 1
+
+
+def _iter_chunks(table):
+    for start in range(0, table.shape[0], chunk_size):
+        yield table.iloc[start : start + chunk_size]
+
+
+def write_csv(table):
+    """
+    Writes a table as CSV, yielding the encoded chunks.
+    """
+    header = True
+    for chunk in _iter_chunks(table):
+        yield chunk.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:
+        yield table.to_csv(index=False).encode("utf-8")
+
+
+def write_csv_gz(table):
+    """
+    Writes a table as gzip-compressed CSV, yielding the compressed chunks.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in write_csv(table):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _Sink:
+    """
+    Write-only file that keeps what was written since it was last drained.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def write_parquet(table):
+    """
+    Writes a table as Parquet, one row group per chunk, yielding the
+    bytes of each row group as soon as it is written.
+    """
+    sink = _Sink()
+    schema = pa.Schema.from_pandas(table, preserve_index=False)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in _iter_chunks(table):
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            )
+            yield sink.drain()
+    yield sink.drain()
+
+
+def write_xlsx(table):
+    """
+    Writes a table as XLSX using the write-only mode of openpyxl, which
+    keeps constant memory by streaming rows to a temporary file. Rows that
+    do not fit in a sheet continue in a new one.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = None
+    nrows = max_sheet_rows
+    for chunk in _iter_chunks(table):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            if nrows == max_sheet_rows:
+                sheet = workbook.create_sheet()
+                sheet.append(list(table.columns))
+                nrows = 0
+            sheet.append(row)
+            nrows += 1
+    if sheet is None:
+        workbook.create_sheet().append(list(table.columns))
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, "rb") as f:
+            for data in iter(lambda: f.read(read_size), b""):
+                yield data
+    finally:
+        os.remove(path)
+
+
+WRITERS = {
+    "csv": write_csv,
+    "csv.gz": write_csv_gz,
+    "parquet": write_parquet,
+    "xlsx": write_xlsx,
+}
+
+
+def get_url(format_, data, table_result, sort_by=None, filter_query=None):
+    """
+    Gets the URL of the export of a result table.
+    """
+    query = {
+        "key": data["key"],
+        "analysis": table_result["id"],
+        "params": json.dumps(table_result["params"]),
+        "sort_by": json.dumps(sort_by or []),
+        "filter_query": filter_query or "",
+    }
+
+    return f"export/{format_}?{urllib.parse.urlencode(query)}"
+
+
+def register_routes(server):
+    """
+    Registers the export endpoint in the Flask server of the app.
+    """
+
+    @server.route("/export/<format_>", methods=["GET"])
+    def export_table(format_):
+        args = flask.request.args
+        analysis = analyses.ANALYSES.get(args.get("analysis"))
+        if format_ not in FORMATS or analysis is None or analysis["kind"] != "table":
+            flask.abort(404)
+        if not re.fullmatch(KEY_PATTERN, args.get("key", "")):
+            flask.abort(404)
+        try:
+            params = json.loads(args.get("params", "{}"))
+            sort_by = json.loads(args.get("sort_by", "[]"))
+        except ValueError:
+            flask.abort(400)
+        if not isinstance(params, dict) or not set(params) <= set(analysis["params"]):
+            flask.abort(400)
+        result, _ = analyses.run_cached(
+            args["analysis"], {"key": args["key"]}, **params
+        )
+        if result is None:
+            flask.abort(404)
+        table = paging.sort_table(
+            paging.filter_table(result, args.get("filter_query")), sort_by
+        )
+        extension, mimetype = FORMATS[format_]
+
+        return flask.Response(
+            flask.stream_with_context(WRITERS[format_](table)),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="{args["analysis"]}.{extension}"'
+                )
+            },
+        )
@@ -0,0 +1,251 @@
+"""
+Figures built from the tables of a project and the structures derived
+from them.
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+from utils import derived, lazy
+
+pd = lazy.Module("pandas")
+
+px = lazy.Module("plotly.express")
+
+# Figures with more points than this are rendered with WebGL, as plotly
+# express does by default.
+webgl_points = 1000
+
+# Resolution the presence/absence matrix is aggregated to, about the size
+# (in pixels) of the graph in the app. Zooming in re-aggregates the
+# visible window at the same resolution.
+max_deployments = 150
+
+max_days = 500
+
+# Largest number of labels of the deployments shown on the y-axis.
+max_deployment_labels = 40
+
+
+def plot_accumulation_curve(images, deployments, permutations=0, first_dates=None):
+    date_range = derived.get_date_range(deployments)
+    first_detections = derived.compute_first_detections(
+        images, date_range, first_dates
+    )
+    df = pd.DataFrame(
+        {
+            "day": np.arange(date_range.size),
+            "richness": derived.compute_accumulation(
+                first_detections, date_range.size
+            ),
+        }
+    )
+
+    fig = px.line(
+        df, x="day", y="richness", labels={"day": "Día", "richness": "Riqueza"}
+    )
+
+    if permutations:
+        curves = derived.compute_random_accumulation(
+            images, date_range, permutations=permutations
+        )
+        lower, upper = np.percentile(curves, [2.5, 97.5], axis=0)
+        fig.add_traces(
+            [
+                go.Scatter(
+                    x=np.r_[df["day"], df["day"][::-1]],
+                    y=np.r_[upper, lower[::-1]],
+                    fill="toself",
+                    fillcolor="rgba(99, 110, 250, 0.2)",
+                    line=dict(width=0),
+                    hoverinfo="skip",
+                    name="IC 95%",
+                ),
+                go.Scatter(
+                    x=df["day"],
+                    y=curves.mean(axis=0),
+                    line=dict(dash="dash", color="#636EFA"),
+                    name="Aleatorizada",
+                ),
+            ]
+        )
+        fig.update_layout(
+            legend_title_text="",
+            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        )
+
+    return fig
+
+
+def add_accumulation_curve(fig, images, deployments, name):
+    """
+    Adds the accumulation curve of a subset of the images (e.g. those of
+    a project) to a figure.
+    """
+    date_range = derived.get_date_range(deployments)
+    first_detections = derived.compute_first_detections(images, date_range)
+    fig.add_trace(
+        go.Scatter(
+            x=np.arange(date_range.size),
+            y=derived.compute_accumulation(first_detections, date_range.size),
+            mode="lines",
+            name=name,
+        )
+    )
+    fig.update_layout(showlegend=True)
+
+    return fig
+
+
+def plot_site_dates(deployments):
+    """
+    Plots the dates of each deployment as a segment. All the segments
+    are drawn as a single trace, separated by gaps, instead of a trace
+    per deployment.
+    """
+    deployments = deployments.assign(
+        start_date=pd.to_datetime(deployments["start_date"]),
+        end_date=pd.to_datetime(deployments["end_date"]),
+    ).sort_values("start_date", kind="stable")
+
+    n = deployments.shape[0]
+    x = np.full(n * 3, None, dtype=object)
+    x[0::3] = deployments["start_date"].dt.strftime("%Y-%m-%d").to_numpy()
+    x[1::3] = deployments["end_date"].dt.strftime("%Y-%m-%d").to_numpy()
+    y = np.full(n * 3, None, dtype=object)
+    y[0::3] = y[1::3] = deployments["deployment_id"].astype(str).to_numpy()
+
+    trace = go.Scattergl if x.size > webgl_points else go.Scatter
+    fig = go.Figure(
+        trace(
+            x=x,
+            y=y,
+            mode="lines",
+            line=dict(color="#636EFA"),
+            hovertemplate="Evento=%{y}<br>Fecha=%{x}<extra></extra>",
+        )
+    )
+    fig.update_layout(
+        xaxis=dict(title_text="Fecha", type="date"),
+        yaxis=dict(
+            title_text="Evento",
+            type="category",
+            categoryorder="array",
+            categoryarray=pd.unique(y[0::3]),
+        ),
+        showlegend=False,
+    )
+
+    return fig
+
+
+def plot_activity_hours(activity, names):
+    rows = activity["species"].get_indexer(names or [])
+    rows = rows[rows >= 0]
+    if rows.size:
+        # Close the circle so that the curves span from 00:00 to 24:00.
+        density = activity["density"][rows]
+        edge = (density[:, :1] + density[:, -1:]) / 2
+        density = np.hstack([edge, density, edge])
+        hours = np.r_[0, activity["hours"], 24]
+        df = pd.DataFrame(
+            {
+                "x": np.tile(hours, rows.size),
+                "y": density.ravel(),
+                "name": np.repeat(activity["species"][rows], hours.size),
+            }
+        )
+        fig = px.line(
+            df, x="x", y="y", color="name", labels={"x": "Hora", "y": "Densidad"}
+        )
+        ticks = [i for i in range(0, 25) if i % 2 == 0]
+        fig.update_layout(
+            xaxis=dict(
+                tickmode="array",
+                tickvals=ticks,
+                ticktext=list(map(lambda x: f"{str(x).zfill(2)}:00", ticks)),
+            ),
+            legend_title_text="",
+            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        )
+    else:
+        fig = go.Figure()
+    return fig
+
+
+def _get_window(axis_range, size):
+    # Whole rows or columns covering a range of an axis.
+    if axis_range is None:
+        return 0, size
+    start = min(max(int(np.floor(min(axis_range))), 0), size - 1)
+    end = max(min(int(np.ceil(max(axis_range))), size), start + 1)
+
+    return start, end
+
+
+def update_ranges(ranges, relayout_data):
+    """
+    Updates the ranges of the axes of a figure (x_range and y_range) with
+    the changes the user made to them, as reported by the relayoutData of
+    a graph. Ranges reset to the whole figure are removed.
+    """
+    ranges = dict(ranges or {})
+    for axis in ("x", "y"):
+        key = f"{axis}axis.range"
+        if f"{key}[0]" in relayout_data:
+            ranges[f"{axis}_range"] = [
+                relayout_data[f"{key}[0]"],
+                relayout_data[f"{key}[1]"],
+            ]
+        elif key in relayout_data:
+            ranges[f"{axis}_range"] = list(relayout_data[key])
+        elif relayout_data.get(f"{axis}axis.autorange"):
+            ranges.pop(f"{axis}_range", None)
+
+    return ranges
+
+
+def plot_presence_absence(occupancy, name, x_range=None, y_range=None):
+    """
+    Plots the deployment x day presence/absence matrix of a species,
+    aggregated to the resolution of the graph within the ranges of the
+    axes (in days and deployments) when given.
+    """
+    deployment_ids = occupancy["deployment_ids"]
+    matrix, row_edges, col_edges = derived.get_presence_absence(
+        occupancy,
+        name,
+        rows=_get_window(y_range, deployment_ids.size),
+        cols=_get_window(x_range, occupancy["date_range"].size),
+        max_rows=max_deployments,
+        max_cols=max_days,
+    )
+
+    # Rows are labeled with the first deployment of their bin.
+    step = -(-(row_edges.size - 1) // max_deployment_labels)
+    tickvals = (row_edges[:-1:step] + row_edges[1::step]) / 2
+    fig = go.Figure(
+        go.Heatmap(
+            # Shares are sent as whole percentages, a byte per cell.
+            z=(matrix * 100).round().astype(np.uint8),
+            x=col_edges,
+            y=row_edges,
+            zmin=0,
+            zmax=100,
+            colorbar=dict(title_text="Presencia (%)"),
+            hovertemplate="Día=%{x}<br>Presencia=%{z}%<extra></extra>",
+        )
+    )
+    fig.update_layout(
+        xaxis=dict(title_text="Día", range=x_range),
+        yaxis=dict(
+            title_text="Evento",
+            tickmode="array",
+            tickvals=tickvals,
+            ticktext=deployment_ids[row_edges[:-1:step]],
+            # Deployments are listed from the top, as in the tables.
+            range=sorted(y_range, reverse=True) if y_range else None,
+            autorange=None if y_range else "reversed",
+        ),
+    )
+
+    return fig
@@ -0,0 +1,301 @@
+"""
+Ingestion of Wildlife Insights projects. CSV files are parsed directly
+from the members of the ZIP archive, with explicit dtypes and only the
+columns the analyses use.
+"""
+import pathlib
+from zipfile import ZipFile
+
+from utils import derived, lazy, metrics, storage
+
+pd = lazy.Module("pandas")
+
+wiutils = lazy.Module("wiutils")
+
+IMAGE_COLUMNS = [
+    "project_id",
+    "deployment_id",
+    "image_id",
+    "location",
+    "identified_by",
+    "wi_taxon_id",
+    "class",
+    "order",
+    "family",
+    "genus",
+    "species",
+    "common_name",
+    "uncertainty",
+    "timestamp",
+    "number_of_objects",
+    "age",
+    "sex",
+    "individual_id",
+    "individual_animal_notes",
+]
+
+IMAGE_DTYPES = {
+    "project_id": str,
+    "deployment_id": str,
+    "image_id": str,
+    "location": str,
+    "identified_by": str,
+    "wi_taxon_id": str,
+    "class": str,
+    "order": str,
+    "family": str,
+    "genus": str,
+    "species": str,
+    "common_name": str,
+    "age": str,
+    "sex": str,
+    "individual_id": str,
+    "individual_animal_notes": str,
+}
+
+DEPLOYMENT_DTYPES = {"project_id": str, "deployment_id": str}
+
+PROJECT_DTYPES = {"project_id": str}
+
+
+def _find_member(z, name):
+    """
+    Finds a table in the archive, either at its root or inside the
+    folder Wildlife Insights wraps the export in.
+    """
+    for member in z.namelist():
+        path = pathlib.PurePosixPath(member)
+        if path.name == name and len(path.parts) <= 2:
+            return member
+
+    raise KeyError(f"There is no {name} in the archive.")
+
+
+def _read_member(z, name, **kwargs):
+    with z.open(_find_member(z, name)) as f:
+        return pd.read_csv(f, **kwargs)
+
+
+def read_project(file):
+    """
+    Reads the images, deployments and projects tables of a project
+    archive. file can be a path or a file-like object. Raises KeyError
+    if any of the tables is missing.
+    """
+    with ZipFile(file) as z:
+        images = _read_member(
+            z,
+            "images.csv",
+            usecols=lambda column: column in IMAGE_COLUMNS,
+            dtype=IMAGE_DTYPES,
+        )
+        deployments = _read_member(z, "deployments.csv", dtype=DEPLOYMENT_DTYPES)
+        projects = _read_member(z, "projects.csv", dtype=PROJECT_DTYPES)
+
+    images["timestamp"] = pd.to_datetime(images["timestamp"])
+
+    return images, deployments, projects
+
+
+def clean_images(images):
+    """
+    Removes images not identified up to genus and adds their scientific
+    name.
+    """
+    images = wiutils.remove_unidentified(images, rank="genus")
+    if images.empty:
+        # wiutils cannot build the names of no images.
+        return images.assign(scientific_name=pd.Series(dtype=object))
+    images["scientific_name"] = wiutils.get_scientific_name(
+        images, keep_genus=True, add_qualifier=True
+    )
+
+    return images
+
+
+def remove_duplicates(images, interval, gaps=None):
+    """
+    Removes the images of a species taken in the same deployment less
+    than interval minutes after the previous one, as
+    wiutils.remove_duplicates does, given the gaps between them (see
+    derived.compute_duplicate_gaps) if already computed.
+    """
+    if gaps is None:
+        gaps = derived.compute_duplicate_gaps(images)
+
+    return images[gaps >= interval * 60]
+
+
+def get_key(digest, remove_duplicates_interval=None):
+    """
+    Gets the key of a project given the hash of its archive and the
+    interval (in minutes) used to remove duplicates, if any.
+    """
+    if remove_duplicates_interval:
+        return f"{digest}:{int(remove_duplicates_interval)}"
+    else:
+        return digest
+
+
+def store_project(path, digest):
+    """
+    Reads and cleans a project archive and stores it under its hash.
+    """
+    with metrics.measure("ingest", "read") as record:
+        images, deployments, projects = read_project(path)
+        record["rows"] = images.shape[0]
+        record["bytes_in"] = pathlib.Path(path).stat().st_size
+    metadata = {"nimages_all": images.shape[0]}
+    with metrics.measure("ingest", "clean") as record:
+        images = clean_images(images)
+        record["rows"] = images.shape[0]
+    with metrics.measure("ingest", "save"):
+        tables = storage.encode_categoricals(
+            {"images": images, "deployments": deployments, "projects": projects}
+        )
+        storage.save(digest, tables, metadata)
+
+
+def append_project(path, digest, base):
+    """
+    Stores a newer export of a stored project under its hash, reading the
+    whole archive but only cleaning the images that are not in the
+    stored project (by image_id), which are appended to its images.
+    Images of the stored project are kept as they were. Returns False
+    (storing nothing) if some of them are no longer in the export.
+    """
+    with metrics.measure("ingest", "read") as record:
+        images, deployments, projects = read_project(path)
+        record["rows"] = images.shape[0]
+        record["bytes_in"] = pathlib.Path(path).stat().st_size
+    stored = storage.load(base, ("images",))
+    with metrics.measure("ingest", "diff") as record:
+        if not stored["images"]["image_id"].isin(images["image_id"]).all():
+            return False
+        new = images[~images["image_id"].isin(stored["images"]["image_id"])]
+        record["rows"] = new.shape[0]
+    metadata = {
+        "nimages_all": images.shape[0],
+        "base": base,
+        "base_images": stored["images"].shape[0],
+    }
+    with metrics.measure("ingest", "clean") as record:
+        new = clean_images(new)
+        record["rows"] = new.shape[0]
+    with metrics.measure("ingest", "save"):
+        tables = storage.encode_categoricals(
+            {"images": new, "deployments": deployments, "projects": projects}
+        )
+        # Exports with no new (identified) images only update the
+        # deployments and projects.
+        if new.empty:
+            tables["images"] = stored["images"]
+        else:
+            tables["images"] = storage.concat(
+                [{"images": stored["images"]}, {"images": tables["images"]}]
+            )["images"]
+        storage.save(digest, tables, metadata)
+
+    return True
+
+
+def get_base(key, metadata):
+    """
+    Gets the key of the project a stored project was appended to, along
+    with the number of images it had, given the key and the metadata of
+    the former. Returns None if it was not appended to another project,
+    or if its duplicates are removed or it is combined with others,
+    which changes its images.
+    """
+    if ":" in key or "+" in key or not metadata.get("base"):
+        return None
+
+    return metadata["base"], metadata["base_images"]
+
+
+def update_project(path, key, remove_duplicates_interval=None):
+    """
+    Stores a newer export of the stored project with the given key,
+    appending its new images to those of the stored project (see
+    append_project), and returns its key. The whole archive is stored
+    if the project cannot be updated. Raises KeyError if any of the
+    tables is missing and BadZipFile if the file is not an archive.
+    """
+    with metrics.measure("ingest", "hash"):
+        digest = storage.hash_file(path)
+    # Combined datasets are not updated, whatever their interval.
+    base = None if "+" in key else key.partition(":")[0]
+    if not storage.exists(digest):
+        if (
+            base is None
+            or not storage.exists(base)
+            or not append_project(path, digest, base)
+        ):
+            store_project(path, digest)
+
+    return get_key(digest, remove_duplicates_interval)
+
+
+def open_project(path, remove_duplicates_interval=None):
+    """
+    Stores a project archive unless it was already stored and returns its
+    key. Raises KeyError if any of the tables is missing and BadZipFile if
+    the file is not an archive.
+    """
+    with metrics.measure("ingest", "hash"):
+        digest = storage.hash_file(path)
+    if not storage.exists(digest):
+        store_project(path, digest)
+
+    return get_key(digest, remove_duplicates_interval)
+
+
+def combine_keys(keys):
+    """
+    Gets the key of the dataset combining several projects given their
+    keys.
+    """
+    return "+".join(sorted(set(keys)))
+
+
+def set_interval(key, remove_duplicates_interval=None):
+    """
+    Gets the key of a dataset with its duplicates removed given another
+    interval (in minutes), or not removed at all.
+    """
+    return combine_keys(
+        get_key(part.partition(":")[0], remove_duplicates_interval)
+        for part in key.split("+")
+    )
+
+
+def load_project(key, names):
+    """
+    Loads (some of) the tables of a single stored project given its key.
+    Returns None if it has not been stored.
+    """
+    digest, _, interval = key.partition(":")
+    if not storage.exists(digest):
+        return None
+
+    tables = storage.load(digest, [name for name in names if name in storage.TABLES])
+    if "images" in tables and interval:
+        tables["images"] = remove_duplicates(tables["images"], int(interval))
+
+    return tables
+
+
+def load_tables(key, names, load=load_project):
+    """
+    Loads (some of) the tables of a stored project, or of several combined
+    projects, given its key. Each project is loaded with load(key, names)
+    (from storage by default). Returns None if any project has not been
+    stored.
+    """
+    if "+" in key:
+        parts = [load(part, names) for part in key.split("+")]
+        if any(part is None for part in parts):
+            return None
+        return storage.concat(parts)
+
+    return load(key, names)
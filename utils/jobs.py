@@ -0,0 +1,23 @@
+"""
+Background job queue for long-running analyses. Jobs are run in their
+own processes by Dash background callbacks, with their state kept in a
+disk cache shared by all the processes of the app.
+"""
+import os
+import pathlib
+import tempfile
+
+import diskcache
+from dash import DiskcacheManager
+
+jobs_dir = pathlib.Path(
+    os.environ.get(
+        "WANKI_JOBS_DIR", pathlib.Path(tempfile.gettempdir()).joinpath("wanki")
+    )
+).joinpath("jobs")
+
+expire = 24 * 60 * 60
+
+manager = DiskcacheManager(
+    diskcache.Cache(jobs_dir.joinpath("callbacks").as_posix()), expire=expire
+)
@@ -1,25 +1,18 @@
 """
 """
-import base64
-import pathlib
-
 import dash.dcc as dcc
 import dash.html as html
 import dash_bootstrap_components as dbc
 from dash.dash_table import DataTable
 
+from utils import sessions
 
-logo_path = pathlib.Path(__file__).parents[1].joinpath("assets/logo.png").as_posix()
-
-encoded_image = base64.b64encode(open(logo_path, "rb").read())
 
+# Logos are served (and cached by the browser) as static files instead of
+# being inlined in every page.
 header = html.Div(
     [
-        html.Div(
-            html.Img(
-                src=f"data:image/png;base64,{encoded_image.decode()}", id="app-logo",
-            )
-        ),
+        html.Div(html.Img(src="assets/logo.png", id="app-logo")),
         html.P(
             """
             Una aplicación para explorar y transformar datos provenientes de Wildlife 
@@ -31,16 +24,10 @@ header = html.Div(
     id="header",
 )
 
-humboldt_logo_path = (
-    pathlib.Path(__file__).parents[1].joinpath("assets/humboldt_logo.png").as_posix()
-)
-
-encoded_image = base64.b64encode(open(humboldt_logo_path, "rb").read())
-
 logo = html.Div(
     [
         html.Img(
-            src=f"data:image/png;base64,{encoded_image.decode()}",
+            src="assets/humboldt_logo.png",
             className="mh-100",
             id="logo",
         )
@@ -62,13 +49,16 @@ images = dbc.Card(
                 ),
                 dbc.Tooltip(
                     """
-                    Carga de archivo .zip con el proyecto descargado de Wildlife Insights
-                    con toda la información correspondiente. El archivo .zip debe contener
-                    cuatro tablas en formato .csv (i.e. cameras.csv, 
+                    Carga de uno o varios archivos .zip con los proyectos descargados de
+                    Wildlife Insights con toda la información correspondiente. Varios
+                    proyectos se combinan en un solo conjunto de datos. Cada archivo .zip
+                    debe contener cuatro tablas en formato .csv (i.e. cameras.csv, 
                     deployments.csv, images.csv y project.csv). Aquellas imágenes que
                     no tengan alguna identificación hasta por lo menos género serán removidas.
                     También es posible eliminar registros duplicados dado un intervalo de
-                    tiempo en minutos.
+                    tiempo en minutos, que puede cambiarse sin volver a cargar los datos.
+                    Al actualizar el proyecto cargado con una exportación más reciente
+                    solo se agregan las imágenes nuevas.
                 """,
                     target="data-info",
                 ),
@@ -89,17 +79,28 @@ images = dbc.Card(
                     [
                         dbc.Col(
                             [
-                                dcc.Upload(
-                                    dbc.Button("Cargar", size="sm"),
-                                    id="upload",
-                                    accept=".zip",
+                                dbc.Button("Cargar", size="sm", id="upload-button"),
+                                dbc.Progress(
+                                    id="upload-progress",
+                                    value=0,
+                                    style={"display": "none"},
                                 ),
+                                dcc.Store(id="upload-file"),
                                 dcc.Checklist(
                                     options=[
                                         {"label": "Remover duplicados", "value": 1}
                                     ],
                                     id="remove-duplicates",
                                 ),
+                                dcc.Checklist(
+                                    options=[
+                                        {
+                                            "label": "Actualizar el proyecto cargado",
+                                            "value": 1,
+                                        }
+                                    ],
+                                    id="update-project",
+                                ),
                                 html.Div(
                                     [
                                         html.P(
@@ -173,20 +174,17 @@ videos = dbc.Card(
                 ),
                 dbc.Tooltip(
                     """
-                    Carga de archivo .zip con el proyecto descargado de Wildlife Insights
-                    con toda la información correspondiente. El archivo .zip debe contener
-                    cuatro tablas en formato .csv (i.e. cameras.csv, 
-                    deployments.csv, images.csv y project.csv). Aquellas imágenes que
-                    no tengan alguna identificación hasta por lo menos género serán removidas.
-                    También es posible eliminar registros duplicados dado un intervalo de
-                    tiempo en minutos.
+                    Carga de uno o varios videos, o de archivos .zip con videos. Si los
+                    videos están en carpetas dentro del archivo .zip, el nombre de la
+                    carpeta se toma como el evento de muestreo, que también se puede
+                    asignar en la tabla de videos.
                 """,
                     target="video-info",
                 ),
                 dbc.Tooltip(
                     """
-                    Los datos cargados no son válidos. Asegurese que es un archivo .zip
-                    y contiene todas las tablas asociadas al proyecto.
+                    Los videos cargados no son válidos. Asegurese que son videos o
+                    archivos .zip con videos.
                 """,
                     target="video-check",
                     id="video-check-tooltip",
@@ -200,11 +198,13 @@ videos = dbc.Card(
                     [
                         dbc.Col(
                             [
-                                dcc.Upload(
-                                    dbc.Button("Cargar", size="sm"),
-                                    id="video-upload",
-                                    #accept=".MP4",
+                                dbc.Button("Cargar", size="sm", id="video-upload-button"),
+                                dbc.Progress(
+                                    id="video-upload-progress",
+                                    value=0,
+                                    style={"display": "none"},
                                 ),
+                                dcc.Store(id="video-upload-file"),
                             ],
                             className="video-box-container",
                             width=7,
@@ -213,7 +213,7 @@ videos = dbc.Card(
                             [
                                 html.P(
                                     [
-                                        html.Span("Nombre:", className="item"),
+                                        html.Span("Videos:", className="item"),
                                         html.Span(id="video-name"),
                                     ]
                                 ),
@@ -237,6 +237,31 @@ videos = dbc.Card(
                 )
             )
         ),
+        dbc.CardBody(
+            DataTable(
+                id="video-table",
+                columns=[
+                    {"name": "Video", "id": "filename"},
+                    {
+                        "name": "Evento",
+                        "id": "deployment_id",
+                        "editable": True,
+                        "presentation": "dropdown",
+                    },
+                    {"name": "Fecha", "id": "timestamp"},
+                    {"name": "Segundos", "id": "seconds", "type": "numeric"},
+                    {"name": "FPS", "id": "fps", "type": "numeric"},
+                    {"name": "Ancho", "id": "width", "type": "numeric"},
+                    {"name": "Alto", "id": "height", "type": "numeric"},
+                ],
+                data=[],
+                page_size=10,
+                sort_action="native",
+                filter_action="native",
+            ),
+            id="video-table-wrapper",
+            style={"display": "none"},
+        ),
     ],
     class_name="w-100",
     id="videos",
@@ -318,6 +343,10 @@ tables = dbc.Accordion(
                                     options=[{"label": "Agregar endemismo", "value": 1}],
                                     id="general-count-endemic",
                                 ),
+                                dcc.Checklist(
+                                    options=[{"label": "Por proyecto", "value": 1}],
+                                    id="general-count-by-project",
+                                ),
                             ],
                             className="input-group",
                         ),
@@ -547,6 +576,16 @@ tables = dbc.Accordion(
                             ],
                             className="input-group",
                         ),
+                        html.Div(
+                            [
+                                html.P("Proyectos", className="input-description"),
+                                dcc.Checklist(
+                                    options=[{"label": "Por proyecto", "value": 1}],
+                                    id="hill-numbers-by-project",
+                                ),
+                            ],
+                            className="input-group",
+                        ),
                     ],
                     className="args",
                 ),
@@ -586,13 +625,46 @@ figures = dbc.Accordion(
                         dbc.PopoverHeader("Curva de acumulación"),
                         dbc.PopoverBody(
                             """
-                        Especies registradas por días de muestreo.
+                        Especies registradas por días de muestreo. Opcionalmente,
+                        curva promedio (e intervalo del 95%) para permutaciones
+                        aleatorias del orden de los días.
                     """
                         ),
                     ],
                     target="accumulation-curve-item",
                     trigger="hover",
                 ),
+                html.Div(
+                    [
+                        html.Div(
+                            [
+                                html.P(
+                                    "Permutaciones", className="input-description"
+                                ),
+                                dbc.Input(
+                                    type="number",
+                                    min=0,
+                                    max=1000,
+                                    step=1,
+                                    id="accumulation-curve-permutations",
+                                    value=0,
+                                ),
+                            ],
+                            className="input-group",
+                        ),
+                        html.Div(
+                            [
+                                html.P("Proyectos", className="input-description"),
+                                dcc.Checklist(
+                                    options=[{"label": "Por proyecto", "value": 1}],
+                                    id="accumulation-curve-by-project",
+                                ),
+                            ],
+                            className="input-group",
+                        ),
+                    ],
+                    className="args",
+                ),
                 dbc.Button("Ejecutar", size="sm", id="accumulation-curve", n_clicks=0),
             ],
             title="Curva de acumulación",
@@ -681,7 +753,8 @@ conversor = dbc.Accordion(
                         dbc.PopoverHeader("Convertidor de video en imágenes"),
                         dbc.PopoverBody(
                             """
-                        Especies registradas por días de muestreo.
+                        Imágenes del video cada cierto número de segundos,
+                        descargadas en un archivo .zip.
                     """
                         ),
                     ],
@@ -707,8 +780,38 @@ conversor = dbc.Accordion(
                             ],
                             className="input-group",
                         ),
+                        dcc.Checklist(
+                            options=[
+                                {"label": "Solo imágenes con movimiento", "value": 1}
+                            ],
+                            id="convert-video-motion",
+                        ),
+                        html.Div(
+                            [
+                                html.P(
+                                    "Área con movimiento (%)",
+                                    className="input-description",
+                                ),
+                                dbc.Input(
+                                    type="number",
+                                    min=0,
+                                    max=100,
+                                    step=0.1,
+                                    id="convert-video-motion-area",
+                                    value=0.5,
+                                ),
+                            ],
+                            className="input-group",
+                        ),
                     ]
-)     
+),
+                html.P(id="convert-video-report"),
+                html.A(
+                    "Descargar imágenes",
+                    id="convert-video-download",
+                    download="imagenes.zip",
+                    style={"display": "none"},
+                ),
             ],
             title="Convertidor de video en imágenes",
             id="convert-video-to-images-item",
@@ -755,6 +858,32 @@ preview = dbc.Card(
                 html.P("Resultados", className="title"),
                 html.Div(
                     [
+                        dbc.Button(
+                            "Cancelar",
+                            size="sm",
+                            id="cancel-job",
+                            disabled=True,
+                            n_clicks=0,
+                        ),
+                        dbc.DropdownMenu(
+                            [
+                                dbc.DropdownMenuItem(
+                                    label,
+                                    id=f"export-{format_.replace('.', '-')}",
+                                    external_link=True,
+                                )
+                                for label, format_ in [
+                                    ("CSV", "csv"),
+                                    ("CSV comprimido", "csv.gz"),
+                                    ("Parquet", "parquet"),
+                                    ("Excel", "xlsx"),
+                                ]
+                            ],
+                            label="Exportar",
+                            size="sm",
+                            id="export-menu",
+                            disabled=True,
+                        ),
                         html.I(className="fas fa-info-circle", id="results-info"),
                         dbc.Tooltip(
                             """
@@ -770,11 +899,22 @@ preview = dbc.Card(
         ),
         dbc.CardBody(
             [
+                dbc.Progress(id="job-progress", value=0, style={"display": "none"}),
                 dcc.Loading(
                     html.Div(
                         [
                             html.Div(
-                                DataTable(id="data-table", export_format="xlsx"),
+                                DataTable(
+                                    id="data-table",
+                                    page_action="custom",
+                                    page_current=0,
+                                    page_size=50,
+                                    sort_action="custom",
+                                    sort_mode="multi",
+                                    sort_by=[],
+                                    filter_action="custom",
+                                    filter_query="",
+                                ),
                                 id="data-table-wrapper",
                             ),
                             html.Div(dcc.Graph(id="graph"), id="graph-wrapper",),
@@ -795,35 +935,92 @@ footer = html.Div(
             Desarrollado por el Programa de Evaluación y Monitoreo de la Biodiversidad - 
             Instituto de Investigación de Recursos Biológicos Alexander von Humboldt.
             """
-        )
+        ),
+        dbc.Button(
+            "Diagnóstico",
+            id="diagnostics-button",
+            color="link",
+            size="sm",
+            n_clicks=0,
+        ),
     ],
     className="text-muted h-100",
     id="footer",
 )
 
-layout = dbc.Container(
+diagnostics = dbc.Offcanvas(
     [
-        dbc.Row(
-            [
-                dbc.Col([header], width=10, class_name="mh-100"),
-                dbc.Col([logo], width=2, class_name="mh-100"),
-            ],
-            style={"height": "15vh"},
+        html.P(
+            """
+            Tiempo, memoria y tamaño de los datos de cada paso de las
+            funciones y análisis ejecutados por todos los usuarios.
+            """,
+            className="text-muted",
         ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [data_box,
-                    functions_box],
-                    width=4,
-                    class_name="mh-100",
-                    id="controls",
-                ),
-                dbc.Col([preview], width=8, class_name="mh-100"),
+        DataTable(
+            id="diagnostics-table",
+            columns=[
+                {"name": "Tipo", "id": "kind"},
+                {"name": "Paso", "id": "name"},
+                {"name": "Llamadas", "id": "count", "type": "numeric"},
+                {"name": "Tiempo total (s)", "id": "seconds", "type": "numeric"},
+                {"name": "Tiempo medio (s)", "id": "mean_seconds", "type": "numeric"},
+                {"name": "Tiempo máximo (s)", "id": "max_seconds", "type": "numeric"},
+                {"name": "Memoria pico (MB)", "id": "peak_memory", "type": "numeric"},
+                {"name": "Filas", "id": "rows", "type": "numeric"},
+                {"name": "Recibido (MB)", "id": "bytes_in", "type": "numeric"},
+                {"name": "Enviado (MB)", "id": "bytes_out", "type": "numeric"},
             ],
-            style={"height": "95vh"},
+            data=[],
+            page_size=25,
+            sort_action="native",
+            filter_action="native",
         ),
-        dbc.Row([dbc.Col([footer])], style={"height": "5vh"}),
-        dcc.Store(id="store", storage_type="memory"),
-    ]
-)
\ No newline at end of file
+        dcc.Interval(id="diagnostics-interval", interval=5000, disabled=True),
+    ],
+    id="diagnostics",
+    title="Diagnóstico",
+    placement="bottom",
+    style={"height": "60vh"},
+    is_open=False,
+)
+
+
+def serve_layout():
+    """
+    Builds the layout of a new page, with the id of a new session (the
+    browser keeps the id it already has for the tab, if any). The
+    directories of expired sessions are removed along the way.
+    """
+    sessions.remove_expired()
+
+    return dbc.Container(
+        [
+            dbc.Row(
+                [
+                    dbc.Col([header], width=10, class_name="mh-100"),
+                    dbc.Col([logo], width=2, class_name="mh-100"),
+                ],
+                style={"height": "15vh"},
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [data_box,
+                        functions_box],
+                        width=4,
+                        class_name="mh-100",
+                        id="controls",
+                    ),
+                    dbc.Col([preview], width=8, class_name="mh-100"),
+                ],
+                style={"height": "95vh"},
+            ),
+            dbc.Row([dbc.Col([footer])], style={"height": "5vh"}),
+            diagnostics,
+            dcc.Store(id="store", storage_type="memory"),
+            dcc.Store(id="table-result", storage_type="memory"),
+            dcc.Store(id="figure-result", storage_type="memory"),
+            dcc.Store(id="session-id", storage_type="session", data=sessions.new_id()),
+        ]
+    )
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Lazy imports of the heavy dependencies of the analyses, so that the app
+starts without loading the libraries of analyses that have not been run
+yet. Once started, the app loads them in the background.
+"""
+import importlib
+import threading
+import time
+
+MODULES = {}
+
+
+class Module:
+    """
+    Stand-in for a module that is imported the first time one of its
+    attributes is accessed.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        # Time (in seconds) it took to import the module.
+        self.seconds = None
+        MODULES[name] = self
+
+    def _load(self):
+        # import_module is thread-safe, so concurrent first accesses
+        # import the module only once.
+        if self._module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self._name)
+            if self._module is None:
+                self.seconds = time.perf_counter() - start
+                self._module = module
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def load_all():
+    """
+    Loads every lazily imported module. Returns the time (in seconds) it
+    took to import each one, wherever it was first loaded.
+    """
+    for module in list(MODULES.values()):
+        module._load()
+
+    return {name: module.seconds for name, module in MODULES.items()}
+
+
+def warm_up(*functions):
+    """
+    Loads every lazily imported module, and then calls functions, in a
+    background thread, so that they are ready before the first analysis
+    without delaying the start of the app.
+    """
+
+    def run():
+        load_all()
+        for function in functions:
+            function()
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+
+    return thread
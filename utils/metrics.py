@@ -0,0 +1,254 @@
+"""
+Timing and profiling of the steps of callbacks, analyses and ingestion.
+Each step records its wall time and, when available, its peak memory,
+the rows it produced and the bytes it received and sent. Measurements
+are aggregated in a disk cache shared by all the processes of the app
+(background jobs and server workers included) and exposed in the
+Prometheus text format.
+"""
+import contextlib
+import functools
+import os
+import pathlib
+import tempfile
+import time
+import tracemalloc
+
+import diskcache
+import flask
+import psutil
+
+from utils import lazy
+
+pd = lazy.Module("pandas")
+
+metrics_dir = pathlib.Path(
+    os.environ.get(
+        "WANKI_METRICS_DIR", pathlib.Path(tempfile.gettempdir()).joinpath("wanki")
+    )
+).joinpath("metrics")
+
+# Tracing allocations slows Python down noticeably, so peak memory is
+# only measured when asked for. Peaks of steps running at once in the
+# same process overlap.
+trace_memory = bool(os.environ.get("WANKI_TRACE_MEMORY"))
+
+FIELDS = (
+    "count",
+    "seconds",
+    "max_seconds",
+    "peak_memory",
+    "rows",
+    "bytes_in",
+    "bytes_out",
+)
+
+store = diskcache.Cache(metrics_dir.as_posix())
+
+if trace_memory:
+    tracemalloc.start()
+
+
+def observe(
+    kind, name, seconds, peak_memory=None, rows=None, bytes_in=None, bytes_out=None
+):
+    """
+    Records a measurement of a step, aggregated with the previous ones of
+    the same kind and name.
+    """
+    key = (kind, name)
+    with store.transact(retry=True):
+        record = store.get(key) or dict.fromkeys(FIELDS, 0)
+        record["count"] += 1
+        record["seconds"] += seconds
+        record["max_seconds"] = max(record["max_seconds"], seconds)
+        if peak_memory is not None:
+            record["peak_memory"] = max(record["peak_memory"], peak_memory)
+        for field, value in (
+            ("rows", rows),
+            ("bytes_in", bytes_in),
+            ("bytes_out", bytes_out),
+        ):
+            if value is not None:
+                record[field] += value
+        store.set(key, record, retry=True)
+
+
+def count_rows(value):
+    """
+    Counts the rows of a table or the points of a figure. Returns None
+    for other values.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.shape[0]
+    data = getattr(value, "data", None)
+    if isinstance(data, tuple):
+        return sum(
+            max(
+                len(values)
+                for values in (getattr(trace, "x", None), getattr(trace, "y", None), ())
+                if values is not None
+            )
+            for trace in data
+        )
+
+    return None
+
+
+@contextlib.contextmanager
+def measure(kind, name):
+    """
+    Measures the block it wraps as a step. Yields a dict in which the
+    block can set the rows, bytes_in and bytes_out of the step. Peak
+    memory is measured over the memory in use when the block starts.
+    """
+    record = {}
+    if trace_memory:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - start
+        if trace_memory:
+            record["peak_memory"] = tracemalloc.get_traced_memory()[1] - baseline
+        observe(kind, name, seconds, **record)
+
+
+def timed(kind, name=None):
+    """
+    Decorator measuring each call of a function as a step, named after the
+    function by default. The rows of its result are counted.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with measure(kind, name or function.__name__) as record:
+                result = function(*args, **kwargs)
+                record["rows"] = count_rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def summarize():
+    """
+    Gets a table with the aggregated measurements of every step, the
+    slowest first.
+    """
+    records = [
+        {"kind": key[0], "name": key[1], **store.get(key, default={})}
+        for key in store.iterkeys()
+    ]
+    summary = pd.DataFrame(records, columns=["kind", "name", *FIELDS]).dropna()
+    summary["mean_seconds"] = summary["seconds"] / summary["count"]
+
+    return summary.sort_values("seconds", ascending=False, ignore_index=True)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(summary, caches=None):
+    """
+    Formats the measurements (and the statistics of some caches of this
+    process) in the Prometheus text exposition format.
+    """
+    series = {
+        "wanki_step_seconds": (
+            "summary",
+            "Wall time of the steps of callbacks, analyses and ingestion.",
+            [("_count", "count"), ("_sum", "seconds")],
+        ),
+        "wanki_step_max_seconds": (
+            "gauge",
+            "Longest wall time of a step.",
+            [("", "max_seconds")],
+        ),
+        "wanki_step_peak_memory_bytes": (
+            "gauge",
+            "Largest peak of traced memory during a step.",
+            [("", "peak_memory")],
+        ),
+        "wanki_step_rows_total": (
+            "counter",
+            "Rows of the tables (or points of the figures) produced by a step.",
+            [("", "rows")],
+        ),
+        "wanki_step_received_bytes_total": (
+            "counter",
+            "Bytes received by a step.",
+            [("", "bytes_in")],
+        ),
+        "wanki_step_sent_bytes_total": (
+            "counter",
+            "Bytes sent by a step.",
+            [("", "bytes_out")],
+        ),
+    }
+    lines = []
+    for metric, (type_, help_, fields) in series.items():
+        lines += [f"# HELP {metric} {help_}", f"# TYPE {metric} {type_}"]
+        for row in summary.itertuples(index=False):
+            labels = f'kind="{_escape(row.kind)}",name="{_escape(row.name)}"'
+            for suffix, field in fields:
+                lines.append(f"{metric}{suffix}{{{labels}}} {getattr(row, field)}")
+
+    process = psutil.Process()
+    lines += [
+        "# HELP wanki_process_resident_memory_bytes Resident memory of the process.",
+        "# TYPE wanki_process_resident_memory_bytes gauge",
+        f"wanki_process_resident_memory_bytes {process.memory_info().rss}",
+    ]
+    samples = {}
+    for cache_name, stats in (caches or {}).items():
+        for stat, value in stats.items():
+            samples.setdefault(f"wanki_cache_{stat}", []).append(
+                f'wanki_cache_{stat}{{cache="{cache_name}"}} {value}'
+            )
+    for metric, lines_ in samples.items():
+        lines += [f"# TYPE {metric} gauge", *lines_]
+
+    return "\n".join(lines) + "\n"
+
+
+def register_routes(server, caches=None):
+    """
+    Registers the /metrics endpoint and measures the requests of the
+    callbacks, whose time includes the serialization of their outputs.
+    caches maps names to functions returning the statistics of a cache.
+    """
+
+    @server.before_request
+    def start_request():
+        flask.g.start = time.perf_counter()
+
+    @server.after_request
+    def measure_request(response):
+        if flask.request.path.endswith("/_dash-update-component"):
+            body = flask.request.get_json(silent=True) or {}
+            # Requests are named after the first output of their callback.
+            output = str(body.get("output", "")).strip(".").split("...")[0]
+            observe(
+                "request",
+                output.partition("@")[0],
+                time.perf_counter() - flask.g.start,
+                bytes_in=flask.request.content_length or 0,
+                bytes_out=response.calculate_content_length() or 0,
+            )
+
+        return response
+
+    @server.route("/metrics", methods=["GET"])
+    def get_metrics():
+        text = format_prometheus(
+            summarize(),
+            {name: function() for name, function in (caches or {}).items()},
+        )
+
+        return flask.Response(text, mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,128 @@
+"""
+Server-side filtering, sorting and pagination of result tables, so that
+only the page the table displays is sent to the browser.
+"""
+from utils import lazy
+
+pd = lazy.Module("pandas")
+
+OPERATORS = {
+    "ge": ("ge", ">="),
+    "le": ("le", "<="),
+    "lt": ("lt", "<"),
+    "gt": ("gt", ">"),
+    "ne": ("ne", "!="),
+    "eq": ("eq", "="),
+    "contains": ("contains",),
+    "datestartswith": ("datestartswith",),
+}
+
+
+def get_columns(table):
+    """
+    Gets the column definitions of a table, typed so that the filters
+    of numeric columns compare numbers instead of strings.
+    """
+    columns = []
+    for column in table.columns:
+        definition = {"name": column, "id": column}
+        if pd.api.types.is_numeric_dtype(table[column]):
+            definition["type"] = "numeric"
+        elif pd.api.types.is_datetime64_any_dtype(table[column]):
+            definition["type"] = "datetime"
+        columns.append(definition)
+
+    return columns
+
+
+def _parse_value(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"`":
+        return value[1:-1].replace("\\" + value[0], value[0])
+
+    return value
+
+
+def _split_filter_part(part):
+    """
+    Splits a part of a filter query of the form '{column} operator value'
+    into its column, operator and value, along with whether the operator
+    is case sensitive.
+    """
+    part = part.strip()
+    if not part.startswith("{") or "}" not in part:
+        return None, None, None, True
+    column, _, rest = part[1:].partition("}")
+    rest = rest.strip()
+    for operator, tokens in OPERATORS.items():
+        for token in tokens:
+            # Operators are optionally prefixed with the case modifiers
+            # (sensitive by default, as in the DataTable).
+            for prefix in ("", "s", "i"):
+                if rest.startswith(prefix + token):
+                    value = rest[len(prefix + token) :]
+                    return column, operator, _parse_value(value), prefix != "i"
+
+    return None, None, None, True
+
+
+def filter_table(table, filter_query):
+    """
+    Filters a table with the query of a DataTable using custom filtering.
+    Parts of the query that cannot be parsed are ignored.
+    """
+    if not filter_query:
+        return table
+
+    mask = pd.Series(True, index=table.index)
+    for part in filter_query.split(" && "):
+        column, operator, value, case = _split_filter_part(part)
+        if column not in table.columns:
+            continue
+        series = table[column]
+        if operator in ("contains", "datestartswith"):
+            series = series.astype(str)
+            if operator == "contains":
+                mask &= series.str.contains(value, case=case, regex=False)
+            else:
+                mask &= series.str.startswith(value)
+        else:
+            if pd.api.types.is_numeric_dtype(series):
+                try:
+                    value = float(value)
+                except ValueError:
+                    continue
+            else:
+                series = series.astype(str)
+            mask &= getattr(series, operator)(value).fillna(False).astype(bool)
+
+    return table[mask]
+
+
+def sort_table(table, sort_by):
+    """
+    Sorts a table with the sort_by property of a DataTable using custom
+    sorting.
+    """
+    sort_by = [item for item in sort_by or [] if item["column_id"] in table.columns]
+    if not sort_by:
+        return table
+
+    return table.sort_values(
+        [item["column_id"] for item in sort_by],
+        ascending=[item["direction"] == "asc" for item in sort_by],
+        kind="stable",
+    )
+
+
+def get_page(table, page_current, page_size, sort_by=None, filter_query=None):
+    """
+    Gets a page of a filtered and sorted table as records, along with the
+    number of pages.
+    """
+    table = sort_table(filter_table(table, filter_query), sort_by)
+    page_count = max(-(-table.shape[0] // page_size), 1)
+    start = page_current * page_size
+    page = table.iloc[start : start + page_size]
+
+    return page.to_dict("records"), page_count
@@ -0,0 +1,137 @@
+"""
+Headless runs of the analyses of the app over project archives. Projects
+are ingested and analyses dispatched exactly as the callbacks do, but
+results are written to disk instead of being sent to the browser.
+"""
+import json
+import pathlib
+import time
+from zipfile import BadZipFile
+
+from utils import analyses, export, ingest
+
+FIGURE_FORMATS = ("html", "json")
+
+
+def parse_param(value):
+    """
+    Parses the value of a parameter given as text, as JSON if possible.
+    """
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def get_params(id_, params):
+    """
+    Gets the parameters an analysis declares out of the parameters given
+    for all the analyses.
+    """
+    return {
+        name: value
+        for name, value in params.items()
+        if name in analyses.ANALYSES[id_]["params"]
+    }
+
+
+def write_result(result, kind, path, table_format="csv", figure_format="html"):
+    """
+    Writes the result of an analysis to path (without its extension) and
+    returns the path of the written file.
+    """
+    if kind == "table":
+        path = path.with_name(f"{path.name}.{table_format}")
+        with open(path, "wb") as f:
+            for chunk in export.WRITERS[table_format](result):
+                f.write(chunk)
+    elif figure_format == "html":
+        path = path.with_name(f"{path.name}.html")
+        result.write_html(path, include_plotlyjs="cdn")
+    else:
+        path = path.with_name(f"{path.name}.json")
+        result.write_json(path)
+
+    return path
+
+
+def run_analyses(
+    name, data, output_dir, ids, params=None, table_format="csv", figure_format="html"
+):
+    """
+    Runs analyses over a project (or several combined projects), writing
+    their results in output_dir. Returns a report with one row per
+    analysis.
+    """
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    params = params or {}
+    reports = []
+    for id_ in ids:
+        start = time.perf_counter()
+        report = {"project": name, "analysis": id_}
+        try:
+            result = analyses.run(id_, data, **get_params(id_, params))
+            output = write_result(
+                result,
+                analyses.ANALYSES[id_]["kind"],
+                output_dir.joinpath(id_),
+                table_format,
+                figure_format,
+            )
+            report["output"] = output.as_posix()
+        except (KeyError, ValueError, TypeError) as e:
+            report["error"] = f"{type(e).__name__}: {e}"
+        report["seconds"] = time.perf_counter() - start
+        reports.append(report)
+
+    return reports
+
+
+def ingest_project(path, remove_duplicates_interval=None):
+    """
+    Stores a project archive. Returns its key and a report of the
+    ingestion.
+    """
+    path = pathlib.Path(path)
+    start = time.perf_counter()
+    try:
+        key = ingest.open_project(path, remove_duplicates_interval)
+    except (KeyError, BadZipFile) as e:
+        return None, {"project": path.name, "analysis": "ingest", "error": str(e)}
+
+    return key, {
+        "project": path.name,
+        "analysis": "ingest",
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def run_project(
+    path,
+    output_dir,
+    ids,
+    params=None,
+    remove_duplicates_interval=None,
+    table_format="csv",
+    figure_format="html",
+):
+    """
+    Runs analyses over a project archive, writing their results in a
+    folder of output_dir named after the archive. Returns a report with
+    one row per analysis.
+    """
+    path = pathlib.Path(path)
+    key, report = ingest_project(path, remove_duplicates_interval)
+    if key is None:
+        return [report]
+
+    return [report] + run_analyses(
+        path.name,
+        {"key": key},
+        pathlib.Path(output_dir).joinpath(path.stem),
+        ids,
+        params,
+        table_format,
+        figure_format,
+    )
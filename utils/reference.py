@@ -0,0 +1,60 @@
+"""
+Taxonomic reference table shipped with the app. Only the columns used
+to annotate results are kept, encoded as categoricals and indexed by
+scientific name. The table is loaded once per process and reloaded when
+the file changes.
+"""
+import pathlib
+import threading
+
+from utils import lazy
+
+pd = lazy.Module("pandas")
+
+path = pathlib.Path(__file__).parents[1].joinpath("assets", "reference.csv")
+
+COLUMNS = {
+    "scientificName": "scientific_name",
+    "threatStatus": "threat_status",
+    "establishmentMeans": "establishment_means",
+}
+
+_lock = threading.Lock()
+_table = None
+_version = None
+
+
+def read(path=path):
+    """
+    Reads the reference table from a file.
+    """
+    table = pd.read_csv(path, usecols=list(COLUMNS), dtype=str)
+    table = table.rename(columns=COLUMNS)
+    table = table.drop_duplicates("scientific_name").set_index("scientific_name")
+
+    return table.astype("category")
+
+
+def get():
+    """
+    Gets the reference table, reading it again if the file changed since
+    it was last read.
+    """
+    global _table, _version
+    version = path.stat().st_mtime_ns
+    with _lock:
+        if _table is None or version != _version:
+            _table = read()
+            _version = version
+
+        return _table
+
+
+def get_version():
+    """
+    Gets the version (the modification time of the file) of the reference
+    table in use.
+    """
+    get()
+
+    return _version
@@ -0,0 +1,65 @@
+"""
+Per-session working directories. Each browser tab gets its own session
+id (kept in its session storage) and the files it uploads or generates
+are stored in a directory of its own, so that simultaneous users never
+read or overwrite each other's files. Directories of sessions idle for
+longer than max_age are removed.
+"""
+import os
+import pathlib
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+sessions_dir = pathlib.Path(
+    os.environ.get(
+        "WANKI_SESSIONS_DIR",
+        pathlib.Path(tempfile.gettempdir()).joinpath("wanki", "sessions"),
+    )
+)
+
+max_age = float(os.environ.get("WANKI_SESSION_HOURS", 24)) * 60 * 60
+
+
+def new_id():
+    """
+    Creates the id of a new session.
+    """
+    return uuid.uuid4().hex
+
+
+def is_valid(id_):
+    return isinstance(id_, str) and re.fullmatch(r"[0-9a-f]{32}", id_) is not None
+
+
+def get_dir(id_, name):
+    """
+    Gets (creating it if needed) a directory of a session. Raises a
+    ValueError if the session id is not valid.
+    """
+    if not is_valid(id_):
+        raise ValueError(f"Invalid session id: {id_!r}")
+    path = sessions_dir.joinpath(id_, name)
+    path.mkdir(parents=True, exist_ok=True)
+    # The session directory is touched on every use to keep it alive.
+    os.utime(path.parent)
+
+    return path
+
+
+def remove_expired():
+    """
+    Removes the directories of the sessions idle for longer than max_age.
+    """
+    if not sessions_dir.exists():
+        return
+    now = time.time()
+    for path in sessions_dir.iterdir():
+        try:
+            expired = now - path.stat().st_mtime > max_age
+        except OSError:
+            continue
+        if expired:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,149 @@
+"""
+Columnar on-disk storage of cleaned projects. Each project is stored
+as Parquet files in a folder named after the hash of its archive, so
+re-opening the same archive is a memory-mapped load instead of a full
+re-ingest.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import uuid
+
+from utils import lazy
+
+pd = lazy.Module("pandas")
+
+storage_dir = pathlib.Path(
+    os.environ.get(
+        "WANKI_STORAGE_DIR", pathlib.Path.home().joinpath(".wanki", "projects")
+    )
+)
+
+TABLES = ("images", "deployments", "projects")
+
+CATEGORICAL_COLUMNS = {
+    "images": ["project_id", "deployment_id", "scientific_name"],
+    "deployments": ["project_id", "deployment_id"],
+}
+
+
+def hash_file(path, chunk_size=2**20):
+    """
+    Computes the SHA-256 hash of a file without reading it into memory
+    at once.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def encode_categoricals(tables):
+    """
+    Encodes the deployment and species columns as categoricals.
+    """
+    tables = dict(tables)
+    for name, columns in CATEGORICAL_COLUMNS.items():
+        tables[name] = tables[name].astype({column: "category" for column in columns})
+
+    return tables
+
+
+def decode_categoricals(tables):
+    """
+    Decodes the deployment and species columns back to plain values.
+    wiutils groups by them without observed=True, which with categoricals
+    yields every combination of their categories.
+    """
+    tables = dict(tables)
+    for name, columns in CATEGORICAL_COLUMNS.items():
+        if name in tables:
+            tables[name] = tables[name].astype({column: object for column in columns})
+
+    return tables
+
+
+def concat(parts):
+    """
+    Concatenates the tables of several projects into a single dataset.
+    Categorical columns share the union of the categories of every
+    project, so the combined tables keep the same compact encoding.
+    """
+    tables = {}
+    for name in parts[0]:
+        if name == "metadata":
+            tables[name] = {
+                "nimages_all": sum(part[name]["nimages_all"] for part in parts)
+            }
+            continue
+        frames = [part[name] for part in parts]
+        # Tables are concatenated column by column, since concatenating
+        # whole frames checks every value of the columns that are empty
+        # (e.g. age or sex) one by one.
+        columns = dict.fromkeys(
+            column for frame in frames for column in frame.columns
+        )
+        for column in columns:
+            series = [
+                frame[column]
+                if column in frame
+                else pd.Series(None, index=frame.index, dtype=object)
+                for frame in frames
+            ]
+            if column in CATEGORICAL_COLUMNS.get(name, []):
+                columns[column] = pd.api.types.union_categoricals(
+                    [values.astype("category") for values in series],
+                    sort_categories=True,
+                )
+            else:
+                columns[column] = pd.concat(series, ignore_index=True)
+        tables[name] = pd.DataFrame(columns)
+
+    return tables
+
+
+def exists(digest):
+    return storage_dir.joinpath(digest, "metadata.json").exists()
+
+
+def save(digest, tables, metadata):
+    """
+    Stores the tables of a project along with its metadata. Files are
+    written to a temporary folder first so that partially written
+    projects are never loaded.
+    """
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    tmp = storage_dir.joinpath(f".{digest}-{uuid.uuid4().hex}")
+    tmp.mkdir()
+    try:
+        for name in TABLES:
+            tables[name].to_parquet(tmp.joinpath(f"{name}.parquet"), index=False)
+        with open(tmp.joinpath("metadata.json"), "w") as f:
+            json.dump(metadata, f)
+        tmp.rename(storage_dir.joinpath(digest))
+    except OSError:
+        # Another process stored the same project in the meantime.
+        if not exists(digest):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load(digest, tables=TABLES):
+    """
+    Loads (some of) the tables of a stored project along with its
+    metadata.
+    """
+    path = storage_dir.joinpath(digest)
+    result = {
+        name: pd.read_parquet(path.joinpath(f"{name}.parquet"), memory_map=True)
+        for name in tables
+    }
+    with open(path.joinpath("metadata.json")) as f:
+        result["metadata"] = json.load(f)
+
+    return result
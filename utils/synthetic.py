@@ -0,0 +1,130 @@
+"""
+Synthetic Wildlife Insights projects, shaped like real exports, used to
+benchmark the ingestion and the analyses at sizes real projects rarely
+reach.
+"""
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# Share of the images that are not identified up to genus (removed when
+# the project is cleaned) and of the ones only identified up to genus.
+unidentified_share = 0.1
+
+genus_share = 0.2
+
+
+def _create_taxa(n_species, rng):
+    genus = np.array([f"Genus{i // 3}" for i in range(n_species)], dtype=object)
+    species = np.array([f"species{i}" for i in range(n_species)], dtype=object)
+    species[rng.random(n_species) < genus_share] = np.nan
+
+    return pd.DataFrame(
+        {
+            "class": "Mammalia",
+            "order": [f"Order{i // 30}" for i in range(n_species)],
+            "family": [f"Family{i // 10}" for i in range(n_species)],
+            "genus": genus,
+            "species": species,
+            "common_name": [f"Common name {i}" for i in range(n_species)],
+            "wi_taxon_id": [
+                f"{i:08x}-0000-0000-0000-{i:012x}" for i in range(n_species)
+            ],
+        }
+    )
+
+
+def create_deployments(n_deployments, rng, start="2021-01-01", days=365):
+    start = pd.Timestamp(start)
+    offsets = rng.integers(0, days // 4, n_deployments)
+    durations = rng.integers(days // 4, days // 2, n_deployments)
+
+    return pd.DataFrame(
+        {
+            "project_id": 1,
+            "deployment_id": [f"Deployment{i:05d}" for i in range(n_deployments)],
+            "placename": [f"Site{i:05d}" for i in range(n_deployments)],
+            "longitude": rng.uniform(-76, -72, n_deployments).round(5),
+            "latitude": rng.uniform(2, 7, n_deployments).round(5),
+            "start_date": (start + pd.to_timedelta(offsets, "D")).strftime("%Y-%m-%d"),
+            "end_date": (
+                start + pd.to_timedelta(offsets + durations, "D")
+            ).strftime("%Y-%m-%d"),
+            "bait_type": "None",
+            "feature_type": "None",
+            "camera_id": np.arange(n_deployments),
+        }
+    )
+
+
+def create_images(n_images, deployments, n_species, rng):
+    taxa = _create_taxa(n_species, rng)
+    # Species abundances follow a geometric series, as in most surveys.
+    weights = 0.9 ** np.arange(n_species)
+    taxon = rng.choice(n_species, n_images, p=weights / weights.sum())
+    deployment = rng.integers(0, deployments.shape[0], n_images)
+    start = pd.to_datetime(deployments["start_date"]).to_numpy()[deployment]
+    end = pd.to_datetime(deployments["end_date"]).to_numpy()[deployment]
+    timestamp = start + ((end - start) * rng.random(n_images)).astype("timedelta64[s]")
+
+    images = taxa.iloc[taxon].reset_index(drop=True)
+    unidentified = rng.random(n_images) < unidentified_share
+    images.loc[unidentified, ["genus", "species", "common_name"]] = np.nan
+    images.insert(0, "project_id", 1)
+    images.insert(
+        1, "deployment_id", deployments["deployment_id"].to_numpy()[deployment]
+    )
+    images.insert(2, "image_id", pd.RangeIndex(n_images).astype(str).str.zfill(9))
+    images["location"] = "gs://bucket/" + images["image_id"] + ".jpg"
+    images["identified_by"] = "Computer vision"
+    images["timestamp"] = pd.Series(timestamp).dt.strftime("%Y-%m-%d %H:%M:%S")
+    images["number_of_objects"] = rng.integers(1, 4, n_images)
+    for column in ("age", "sex", "individual_id", "individual_animal_notes"):
+        images[column] = np.nan
+
+    return images
+
+
+def create_projects():
+    return pd.DataFrame(
+        {
+            "project_id": [1],
+            "project_name": ["Synthetic project"],
+            "project_short_name": ["synthetic"],
+            "project_objectives": ["Benchmark"],
+            "project_species": ["Multiple"],
+            "project_sensor_layout": ["Systematic"],
+            "project_sensor_method": ["Sensor Detection"],
+            "project_bait_use": ["No"],
+            "project_individual_animals": ["No"],
+            "project_admin": ["Wanki"],
+            "project_admin_email": ["wanki@example.org"],
+            "country_code": ["COL"],
+            "embargo": [0],
+            "metadata_license": ["CC0"],
+            "image_license": ["CC0"],
+        }
+    )
+
+
+def _write_table(z, name, table):
+    with z.open(name, "w") as f:
+        with io.TextIOWrapper(f, encoding="utf-8", newline="") as text:
+            table.to_csv(text, index=False)
+
+
+def make_project(path, n_images, n_deployments, n_species=100, seed=0):
+    """
+    Writes a synthetic project archive with n_images images spread over
+    n_deployments deployments and n_species species, inside the folder
+    Wildlife Insights wraps its exports in.
+    """
+    rng = np.random.default_rng(seed)
+    deployments = create_deployments(n_deployments, rng)
+    images = create_images(n_images, deployments, n_species, rng)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        _write_table(z, "synthetic/projects.csv", create_projects())
+        _write_table(z, "synthetic/deployments.csv", deployments)
+        _write_table(z, "synthetic/images.csv", images)
@@ -0,0 +1,110 @@
+"""
+Chunked and resumable upload of project archives and videos. Files are
+streamed to a temporary directory on the server in chunks sent by
+assets/upload.js, instead of traveling through the callbacks as base64
+data URLs. Uploads larger than max_size are rejected and those left
+unfinished or unused for longer than max_age are removed.
+"""
+import os
+import pathlib
+import re
+import tempfile
+import time
+import uuid
+
+import flask
+
+from utils import metrics
+
+upload_dir = pathlib.Path(
+    os.environ.get(
+        "WANKI_UPLOAD_DIR", pathlib.Path(tempfile.gettempdir()).joinpath("wanki")
+    )
+).joinpath("uploads")
+
+read_size = 2**20
+
+max_size = int(os.environ.get("WANKI_UPLOAD_MAX_MB", 4096)) * 2**20
+
+max_age = float(os.environ.get("WANKI_UPLOAD_HOURS", 24)) * 60 * 60
+
+
+def get_upload_path(id_):
+    """
+    Gets the path of an upload given its id. Returns None if the id is
+    not valid or the upload does not exist.
+    """
+    if not isinstance(id_, str) or not re.fullmatch(r"[0-9a-f]{32}", id_):
+        return None
+    path = upload_dir.joinpath(f"{id_}.upload")
+    if not path.exists():
+        return None
+
+    return path
+
+
+def remove_expired():
+    """
+    Removes the uploads that did not receive a chunk for longer than
+    max_age, such as those of closed tabs, which are never consumed.
+    """
+    if not upload_dir.exists():
+        return
+    now = time.time()
+    for path in upload_dir.glob("*.upload"):
+        try:
+            expired = now - path.stat().st_mtime > max_age
+        except OSError:
+            continue
+        if expired:
+            path.unlink(missing_ok=True)
+
+
+def register_routes(server):
+    """
+    Registers the upload endpoints in the Flask server of the app.
+    """
+
+    @server.route("/upload", methods=["POST"])
+    def create_upload():
+        remove_expired()
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        id_ = uuid.uuid4().hex
+        upload_dir.joinpath(f"{id_}.upload").touch()
+
+        return flask.jsonify(id=id_, size=0)
+
+    @server.route("/upload/<id_>", methods=["GET"])
+    def get_upload(id_):
+        path = get_upload_path(id_)
+        if path is None:
+            flask.abort(404)
+
+        return flask.jsonify(id=id_, size=path.stat().st_size)
+
+    @server.route("/upload/<id_>", methods=["PUT"])
+    def append_chunk(id_):
+        path = get_upload_path(id_)
+        if path is None:
+            flask.abort(404)
+        size = path.stat().st_size
+        offset = flask.request.args.get("offset", type=int)
+        # Chunks must arrive in order. Clients resume from the size
+        # returned on conflict.
+        if offset != size:
+            return flask.jsonify(id=id_, size=size), 409
+        too_large = size + (flask.request.content_length or 0) > max_size
+        with metrics.measure("upload", "chunk") as record, open(path, "ab") as f:
+            while not too_large:
+                chunk = flask.request.stream.read(read_size)
+                if not chunk:
+                    break
+                too_large = f.tell() + len(chunk) > max_size
+                if not too_large:
+                    f.write(chunk)
+            record["bytes_in"] = f.tell() - size
+        if too_large:
+            path.unlink(missing_ok=True)
+            flask.abort(413)
+
+        return flask.jsonify(id=id_, size=path.stat().st_size)
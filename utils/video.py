@@ -0,0 +1,413 @@
+"""
+Ingestion of camera trap videos and extraction of their frames. Videos
+are stored under unique names in the directory of the session that
+uploaded them and probed concurrently. Frames are taken
+at a fixed interval by seeking to them instead of decoding every frame,
+in batches spread over a process pool, and written as JPEGs into a ZIP
+archive as the batches arrive.
+"""
+import datetime
+import os
+import pathlib
+import re
+import shutil
+import struct
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from zipfile import ZIP_STORED, ZipFile, is_zipfile
+
+import flask
+import numpy as np
+
+from utils import lazy, metrics, sessions
+
+cv2 = lazy.Module("cv2")
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".avi", ".mkv", ".wmv", ".3gp")
+
+# Origin of the timestamps of QuickTime and MP4 files.
+MP4_EPOCH = datetime.datetime(1904, 1, 1)
+
+# Frames closer than this to the current position are reached by
+# grabbing (decoding without converting) the frames in between, which is
+# cheaper than seeking back to the previous keyframe.
+min_seek_seconds = 2
+
+batch_size = 32
+
+jpeg_quality = 90
+
+# Motion is detected on grayscale copies of the frames downscaled to this
+# width, in which pixels differing from the background by more than
+# pixel_threshold (out of 255) count as changed.
+motion_width = 160
+
+pixel_threshold = 25
+
+min_background_frames = 5
+
+
+def probe(path):
+    """
+    Gets the number of frames, frame rate, duration (in seconds) and size
+    of a video. Returns None if the video cannot be read.
+    """
+    capture = cv2.VideoCapture(str(path))
+    try:
+        if not capture.isOpened():
+            return None
+        frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if frames <= 0 or fps <= 0:
+            return None
+
+        return {
+            "frames": frames,
+            "fps": fps,
+            "seconds": frames / fps,
+            "width": int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+    finally:
+        capture.release()
+
+
+def _read_atoms(f, end):
+    while f.tell() + 8 <= end:
+        start = f.tell()
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield kind, start + header, start + size
+        f.seek(start + size)
+
+
+def read_creation_time(path):
+    """
+    Reads the creation time stored in the movie header of MP4 and
+    QuickTime files. Returns None if the file has none.
+    """
+    try:
+        with open(path, "rb") as f:
+            for kind, start, end in _read_atoms(f, os.fstat(f.fileno()).st_size):
+                if kind != b"moov":
+                    continue
+                f.seek(start)
+                for kind, start, _ in _read_atoms(f, end):
+                    if kind != b"mvhd":
+                        continue
+                    f.seek(start)
+                    version = f.read(4)[0]
+                    if version == 1:
+                        seconds = struct.unpack(">Q", f.read(8))[0]
+                    else:
+                        seconds = struct.unpack(">I", f.read(4))[0]
+                    if seconds == 0:
+                        return None
+                    return MP4_EPOCH + datetime.timedelta(seconds=seconds)
+    except (OSError, struct.error, IndexError, OverflowError):
+        pass
+
+    return None
+
+
+def get_video_path(session_id, id_):
+    """
+    Gets the path of a video stored by a session given its id. Returns
+    None if the ids are not valid or the video does not exist.
+    """
+    if not isinstance(id_, str) or not re.fullmatch(r"[0-9a-f]{32}\.[0-9a-z]+", id_):
+        return None
+    if not sessions.is_valid(session_id):
+        return None
+    path = sessions.sessions_dir.joinpath(session_id, "videos", id_)
+    if not path.exists():
+        return None
+
+    return path
+
+
+def _new_video(videos_dir, filename):
+    id_ = uuid.uuid4().hex + pathlib.PurePath(filename).suffix.lower()
+
+    return id_, videos_dir.joinpath(id_)
+
+
+def store_videos(session_id, path, filename, modified=None):
+    """
+    Stores an uploaded video, or the videos inside an uploaded ZIP
+    archive, under unique names in the directory of a session. The folder
+    a video is in inside the archive is taken as its deployment. Returns a
+    row for each video with its id, name, deployment and modification
+    time.
+    """
+    videos_dir = sessions.get_dir(session_id, "videos")
+    rows = []
+    if is_zipfile(path):
+        with ZipFile(path) as z:
+            for info in z.infolist():
+                member = pathlib.PurePosixPath(info.filename)
+                if info.is_dir() or member.suffix.lower() not in VIDEO_EXTENSIONS:
+                    continue
+                id_, output = _new_video(videos_dir, member.name)
+                with z.open(info) as src, open(output, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                rows.append(
+                    {
+                        "id": id_,
+                        "filename": member.name,
+                        "deployment_id": member.parent.name or None,
+                        "modified": datetime.datetime(*info.date_time),
+                    }
+                )
+        os.remove(path)
+    elif pathlib.PurePath(filename).suffix.lower() in VIDEO_EXTENSIONS:
+        id_, output = _new_video(videos_dir, filename)
+        shutil.move(path, output)
+        rows.append(
+            {
+                "id": id_,
+                "filename": filename,
+                "deployment_id": None,
+                "modified": modified,
+            }
+        )
+    else:
+        os.remove(path)
+
+    return rows
+
+
+def describe(session_id, row):
+    """
+    Adds the metadata of a video stored by a session to its row. Returns
+    None if the video cannot be read.
+    """
+    path = get_video_path(session_id, row["id"])
+    info = probe(path) if path is not None else None
+    if info is None:
+        if path is not None:
+            path.unlink()
+        return None
+    timestamp = read_creation_time(path) or row["modified"]
+
+    return {
+        "id": row["id"],
+        "filename": row["filename"],
+        "deployment_id": row["deployment_id"],
+        "timestamp": timestamp.isoformat(sep=" ") if timestamp else None,
+        "seconds": round(info["seconds"], 2),
+        "fps": round(info["fps"], 2),
+        "width": info["width"],
+        "height": info["height"],
+        "frames": info["frames"],
+    }
+
+
+def describe_videos(session_id, rows, workers=None):
+    """
+    Adds the metadata of some videos stored by a session to their rows,
+    probing them concurrently (OpenCV releases the GIL while reading).
+    Videos that cannot be read are removed.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        described = executor.map(describe, [session_id] * len(rows), rows)
+
+        return [row for row in described if row is not None]
+
+
+def get_frame_indices(frames, fps, interval):
+    """
+    Gets the indices of the frames taken every interval seconds.
+    """
+    step = max(int(round(interval * fps)), 1)
+
+    return np.arange(0, frames, step)
+
+
+def read_frames(path, indices, fps):
+    """
+    Reads some frames of a video, sorted by index. Yields the index and
+    the image of each frame.
+    """
+    capture = cv2.VideoCapture(str(path))
+    try:
+        position = 0
+        for index in indices:
+            if index < position or index - position > min_seek_seconds * fps:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            while position < index and capture.grab():
+                position += 1
+            ok, image = capture.read()
+            if not ok:
+                break
+            position += 1
+            yield index, image
+    finally:
+        capture.release()
+
+
+def _downscale(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    height = max(int(round(gray.shape[0] * motion_width / gray.shape[1])), 1)
+    small = cv2.resize(gray, (motion_width, height), interpolation=cv2.INTER_AREA)
+
+    return cv2.GaussianBlur(small, (5, 5), 0)
+
+
+def detect_motion(images, min_area=0.005):
+    """
+    Detects which frames of a batch (downscaled grayscale images) have
+    activity. The median of the batch is taken as the background, and a
+    frame has activity if at least min_area of its pixels differ from it.
+    Batches too small to estimate the background are kept whole.
+    """
+    if len(images) < min_background_frames:
+        return np.ones(len(images), dtype=bool)
+    images = np.stack(images).astype(np.int16)
+    background = np.median(images, axis=0)
+    changed = np.abs(images - background) > pixel_threshold
+
+    return changed.mean(axis=(1, 2)) >= min_area
+
+
+def extract_batch(path, indices, fps, name=None, min_area=None, quality=jpeg_quality):
+    """
+    Extracts a batch of frames of a video as JPEGs. Frames are named
+    after name (the stem of the video by default). If min_area is given,
+    only frames with activity (see detect_motion) are kept. Returns the
+    name and the encoded image of each frame kept, and the number of
+    frames read.
+    """
+    path = pathlib.Path(path)
+    name = name or path.stem
+    frames = []
+    small = []
+    for index, image in read_frames(path, indices, fps):
+        ok, buffer = cv2.imencode(
+            ".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        )
+        if ok:
+            seconds = index / fps
+            frames.append(
+                (f"{name}_{index:06d}_{seconds:09.3f}s.jpg", buffer.tobytes())
+            )
+            # Only downscaled copies are kept in memory to detect motion.
+            if min_area is not None:
+                small.append(_downscale(image))
+    nread = len(frames)
+    if min_area is not None:
+        mask = detect_motion(small, min_area)
+        frames = [frame for frame, keep in zip(frames, mask) if keep]
+
+    return frames, nread
+
+
+def get_batches(paths, interval, names=None):
+    """
+    Splits the frames to extract from some videos into batches of similar
+    size. Videos that cannot be read are skipped.
+    """
+    batches = []
+    for path, name in zip(paths, names or [None] * len(paths)):
+        info = probe(path)
+        if info is None:
+            continue
+        name = name or f"{pathlib.Path(path).stem}/{pathlib.Path(path).stem}"
+        indices = get_frame_indices(info["frames"], info["fps"], interval)
+        nbatches = -(-indices.size // batch_size)
+        for batch in np.array_split(indices, nbatches):
+            batches.append((path, batch, info["fps"], name))
+
+    return batches
+
+
+def extract_frames(
+    paths,
+    output,
+    interval=1,
+    names=None,
+    min_area=None,
+    workers=None,
+    progress=None,
+):
+    """
+    Extracts a frame every interval seconds from some videos into a ZIP
+    archive. names, if given, are the paths (without extension) inside
+    the archive the frames of each video are named after. If min_area is
+    given, only frames with activity are kept (see detect_motion). output
+    can be a path or a (possibly unseekable) file-like object. progress,
+    if given, is called with the number of batches done and the total.
+    Returns a report with the number of videos, frames sampled and kept,
+    and the throughput.
+    """
+    start = time.perf_counter()
+    batches = get_batches(paths, interval, names)
+    nframes = 0
+    nsampled = 0
+    with ZipFile(output, "w", compression=ZIP_STORED) as z:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = (
+                executor.map(
+                    extract_batch, *zip(*batches), [min_area] * len(batches)
+                )
+                if batches
+                else []
+            )
+            for i, (frames, nread) in enumerate(results):
+                for name, data in frames:
+                    z.writestr(name, data)
+                nframes += len(frames)
+                nsampled += nread
+                if progress is not None:
+                    progress(i + 1, len(batches))
+    seconds = time.perf_counter() - start
+    metrics.observe("video", "extract_frames", seconds, rows=nframes)
+
+    return {
+        "videos": len({batch[0] for batch in batches}),
+        "sampled": nsampled,
+        "frames": nframes,
+        "seconds": seconds,
+        "frames_per_second": nsampled / seconds,
+    }
+
+
+def new_frames_path(session_id):
+    """
+    Gets a new path for a ZIP archive of frames extracted by a session.
+    """
+    return sessions.get_dir(session_id, "frames").joinpath(f"{uuid.uuid4().hex}.zip")
+
+
+def get_frames_url(session_id, path):
+    """
+    Gets the URL an archive of extracted frames is downloaded from.
+    """
+    return f"frames/{session_id}/{pathlib.Path(path).stem}.zip"
+
+
+def register_routes(server):
+    """
+    Registers the endpoint serving the archives of extracted frames.
+    """
+
+    @server.route("/frames/<session_id>/<id_>.zip", methods=["GET"])
+    def download_frames(session_id, id_):
+        if not sessions.is_valid(session_id) or not re.fullmatch(r"[0-9a-f]{32}", id_):
+            flask.abort(404)
+
+        return flask.send_from_directory(
+            sessions.sessions_dir.joinpath(session_id, "frames"),
+            f"{id_}.zip",
+            as_attachment=True,
+            download_name="imagenes.zip",
+        )
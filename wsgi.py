@@ -0,0 +1,30 @@
+"""
+WSGI entry point of the app for production servers, e.g.
+
+    gunicorn wsgi:server --workers 4 --threads 8 --bind 0.0.0.0:8050
+"""
+import time
+
+start = time.perf_counter()
+
+from utils import lazy, metrics, reference  # noqa: E402
+from utils.app import app  # noqa: E402
+from utils.callbacks import generate_callbacks  # noqa: E402
+from utils.layout import serve_layout  # noqa: E402
+
+imported = time.perf_counter()
+app.layout = serve_layout
+generate_callbacks(app)
+ready = time.perf_counter()
+
+# Time (in seconds) of each phase of the start of this process.
+STARTUP = {"imports": imported - start, "callbacks": ready - imported}
+for phase, seconds in STARTUP.items():
+    metrics.observe("startup", phase, seconds)
+
+# Load the libraries of the analyses and the reference table right after
+# start up instead of on the first request (background jobs inherit
+# them), without delaying the start.
+warm_up = lazy.warm_up(reference.get)
+
+server = app.server